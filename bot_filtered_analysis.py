@@ -1,54 +1,99 @@
 import pandas as pd
-import sqlite3
+import numpy as np
+from db import ensure_schema, get_conn
 
-def analyze_conversion_without_bots():
+def analyze_conversion_without_bots(verbose=False):
     """
     Re-analyze conversion rates with bots filtered out.
+    
+    With verbose=True, also print the comparison against the original
+    bot-included analysis.
     """
     
     # Connect to database
-    conn = sqlite3.connect('marketplace_analysis.db')
+    conn = get_conn()
+    # Databases with text True/False flags are converted once, so is_bot = 0 matches
+    ensure_schema(conn)
+    cursor = conn.cursor()
     
     print("Loading data with bot filtering...")
     
-    # Load data filtering out bots
-    search_events = pd.read_sql_query("SELECT * FROM search_events WHERE is_bot = 'False'", conn)
-    click_events = pd.read_sql_query("SELECT * FROM listing_views WHERE is_bot = 'False'", conn)
-    reservations = pd.read_sql_query("SELECT * FROM reservations", conn)
-    
-    print(f"Non-bot search events: {len(search_events):,}")
-    print(f"Non-bot listing views: {len(click_events):,}")
-    print(f"Total reservations: {len(reservations):,}")
-    
-    # Convert timestamps
-    search_events['event_time'] = pd.to_datetime(search_events['event_time'])
-    click_events['event_time'] = pd.to_datetime(click_events['event_time'])
-    reservations['created_at'] = pd.to_datetime(reservations['created_at'])
-    
-    # Get users who completed the full funnel (non-bot only)
-    searchers = set(search_events['merged_amplitude_id'].unique())
-    clickers = set(click_events['merged_amplitude_id'].unique())
-    reservers = set(reservations['renter_user_id'].unique())
-    
-    # Users who did the full funnel
-    funnel_users = searchers.intersection(clickers).intersection(reservers)
+    # Pull only the distinct user IDs for each funnel stage; the row-level
+    # data is never needed here
+    cursor.execute("SELECT DISTINCT merged_amplitude_id FROM search_events WHERE is_bot = 0")
+    search_ids = np.fromiter((row[0] for row in cursor), dtype=object)
+    cursor.execute("SELECT DISTINCT merged_amplitude_id FROM listing_views WHERE is_bot = 0")
+    click_ids = np.fromiter((row[0] for row in cursor), dtype=object)
+    cursor.execute("SELECT DISTINCT renter_user_id FROM reservations WHERE renter_user_id IS NOT NULL")
+    reserve_ids = np.fromiter((row[0] for row in cursor), dtype=object)
+    
+    # Row counts for the load summary, counted in SQL rather than loaded
+    search_count, view_count, reservation_count = conn.execute("""
+        SELECT (SELECT COUNT(*) FROM search_events WHERE is_bot = 0),
+               (SELECT COUNT(*) FROM listing_views WHERE is_bot = 0),
+               (SELECT COUNT(*) FROM reservations)
+    """).fetchone()
+    
+    print(f"Non-bot search events: {search_count:,}")
+    print(f"Non-bot listing views: {view_count:,}")
+    print(f"Total reservations: {reservation_count:,}")
+    
+    # Map every user ID into one shared integer code space; each stage's codes
+    # are already unique (SELECT DISTINCT), so intersections are sorted merges
+    codes, uniques = pd.factorize(np.concatenate([search_ids, click_ids, reserve_ids]))
+    codes = codes.astype(np.int32)
+    search_codes = codes[:len(search_ids)]
+    click_codes = codes[len(search_ids):len(search_ids) + len(click_ids)]
+    reserve_codes = codes[len(search_ids) + len(click_ids):]
+    
+    # Users who did the full funnel (the search/click overlap is reused below)
+    searched_and_clicked = np.intersect1d(search_codes, click_codes, assume_unique=True)
+    funnel_users = np.intersect1d(searched_and_clicked, reserve_codes, assume_unique=True)
+    
+    total_searchers = len(search_codes)
+    total_clickers = len(click_codes)
+    total_reservers = len(reserve_codes)
+    total_searched_and_clicked = len(searched_and_clicked)
+    total_funnel_users = len(funnel_users)
     
     print(f"\n=== NON-BOT CONVERSION ANALYSIS ===")
-    print(f"Total non-bot searchers: {len(searchers):,}")
-    print(f"Total non-bot clickers: {len(clickers):,}")
-    print(f"Total reservers: {len(reservers):,}")
-    print(f"Users who completed full funnel: {len(funnel_users):,}")
+    print(f"Total non-bot searchers: {total_searchers:,}")
+    print(f"Total non-bot clickers: {total_clickers:,}")
+    print(f"Total reservers: {total_reservers:,}")
+    print(f"Users who completed full funnel: {total_funnel_users:,}")
     
     # Calculate conversion rates
-    search_to_click_rate = len(searchers.intersection(clickers)) / len(searchers) * 100
-    click_to_reserve_rate = len(searchers.intersection(clickers).intersection(reservers)) / len(searchers.intersection(clickers)) * 100
-    search_to_reserve_rate = len(funnel_users) / len(searchers) * 100
+    search_to_click_rate = total_searched_and_clicked / total_searchers * 100 if total_searchers > 0 else 0
+    click_to_reserve_rate = total_funnel_users / total_searched_and_clicked * 100 if total_searched_and_clicked > 0 else 0
+    search_to_reserve_rate = total_funnel_users / total_searchers * 100 if total_searchers > 0 else 0
     
     print(f"\n=== CONVERSION RATES (NO BOTS) ===")
     print(f"Search to Click rate: {search_to_click_rate:.2f}%")
     print(f"Click to Reserve rate: {click_to_reserve_rate:.2f}%")
     print(f"Search to Reserve rate: {search_to_reserve_rate:.2f}%")
     
+    results = {
+        'non_bot_searchers': total_searchers,
+        'non_bot_clickers': total_clickers,
+        'funnel_users': total_funnel_users,
+        'search_to_click_rate': search_to_click_rate,
+        'click_to_reserve_rate': click_to_reserve_rate,
+        'search_to_reserve_rate': search_to_reserve_rate
+    }
+    
+    if verbose:
+        print_bot_filtering_comparison(results)
+    
+    return results
+
+def print_bot_filtering_comparison(results):
+    """
+    Compare the bot-filtered results with the original (bot-included) analysis.
+    """
+    total_searchers = results['non_bot_searchers']
+    total_funnel_users = results['funnel_users']
+    search_to_reserve_rate = results['search_to_reserve_rate']
+    
     # Compare with original analysis (including bots)
     print(f"\n=== COMPARISON WITH BOT-INCLUDED ANALYSIS ===")
     print("Original analysis (with bots):")
@@ -56,8 +101,8 @@ def analyze_conversion_without_bots():
     print("- Funnel users: 597") 
     print("- Search to Reserve rate: 7.52%")
     print("\nFiltered analysis (no bots):")
-    print(f"- Total searchers: {len(searchers):,}")
-    print(f"- Funnel users: {len(funnel_users):,}")
+    print(f"- Total searchers: {total_searchers:,}")
+    print(f"- Funnel users: {total_funnel_users:,}")
     print(f"- Search to Reserve rate: {search_to_reserve_rate:.2f}%")
     
     # Calculate the impact of bot filtering
@@ -65,25 +110,14 @@ def analyze_conversion_without_bots():
     original_funnel = 597
     original_rate = 7.52
     
-    searcher_change = (len(searchers) - original_searchers) / original_searchers * 100
-    funnel_change = (len(funnel_users) - original_funnel) / original_funnel * 100
+    searcher_change = (total_searchers - original_searchers) / original_searchers * 100
+    funnel_change = (total_funnel_users - original_funnel) / original_funnel * 100
     rate_change = search_to_reserve_rate - original_rate
     
     print(f"\n=== BOT FILTERING IMPACT ===")
     print(f"Searcher count change: {searcher_change:+.2f}%")
     print(f"Funnel user count change: {funnel_change:+.2f}%")
     print(f"Conversion rate change: {rate_change:+.2f} percentage points")
-    
-    conn.close()
-    
-    return {
-        'non_bot_searchers': len(searchers),
-        'non_bot_clickers': len(clickers),
-        'funnel_users': len(funnel_users),
-        'search_to_click_rate': search_to_click_rate,
-        'click_to_reserve_rate': click_to_reserve_rate,
-        'search_to_reserve_rate': search_to_reserve_rate
-    }
 
 if __name__ == "__main__":
-    results = analyze_conversion_without_bots()
+    results = analyze_conversion_without_bots(verbose=True)
@@ -1,21 +1,25 @@
-import sqlite3
-
-conn = sqlite3.connect('marketplace_analysis.db')
-cursor = conn.cursor()
-cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-tables = cursor.fetchall()
-print('Existing tables:', [table[0] for table in tables])
-
-# Check if we have data
-for table in tables:
-    table_name = table[0]
-    cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
-    count = cursor.fetchone()[0]
-    print(f'{table_name}: {count} rows')
-
-conn.close()
-
-
-
-
-
+from db import DB_PATH, get_conn
+
+def inspect_db(path=DB_PATH):
+    """
+    Return {table name: [column names]} using catalog metadata only.
+    """
+    conn = get_conn(path)
+    tables = [name for name, in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+    
+    # PRAGMA table_info rows are (cid, name, type, notnull, dflt_value, pk);
+    # it reads the schema without touching any table data
+    schema = {table: [column[1] for column in conn.execute(f'PRAGMA table_info("{table}")')]
+              for table in tables}
+    
+    return schema
+
+if __name__ == "__main__":
+    tables = list(inspect_db())
+    print('Existing tables:', tables)
+    
+    # Check if we have data (all row counts in a single statement)
+    if tables:
+        counts = get_conn().execute(" UNION ALL ".join(f"SELECT '{table_name}', COUNT(*) FROM \"{table_name}\"" for table_name in tables))
+        for table_name, count in counts.fetchall():
+            print(f'{table_name}: {count} rows')
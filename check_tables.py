@@ -1,10 +1,5 @@
-import sqlite3
+from check_db import inspect_db
 
-conn = sqlite3.connect('marketplace_analysis.db')
-cursor = conn.cursor()
-cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-tables = cursor.fetchall()
 print('Available tables:')
-for table in tables:
-    print(f'- {table[0]}')
-conn.close()
+for table in inspect_db():
+    print(f'- {table}')
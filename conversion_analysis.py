@@ -18,6 +18,9 @@ from datetime import datetime, timedelta
 import warnings
 import sqlite3
 import os
+from concurrent.futures import ThreadPoolExecutor
+from csv_cache import load_cached
+from db import ensure_schema, get_conn
 warnings.filterwarnings('ignore')
 
 # Set plotting style
@@ -33,37 +36,46 @@ def create_database_from_csvs():
     """Create SQLite database from CSV files for SQL analysis"""
     print("Creating SQLite database from CSV files...")
     
-    # Create database connection
-    conn = sqlite3.connect('marketplace_analysis.db')
+    # Shared database connection (WAL mode)
+    conn = get_conn()
     
-    # Load CSV files
+    # Load CSV files (typed reads, served from the Parquet cache when fresh)
     print("Loading CSV files...")
-    search_events = pd.read_csv('all_search_events (1).csv')
-    listing_views = pd.read_csv('view_listing_detail_events (1).csv')
-    reservations = pd.read_csv('reservations (1).csv')
-    user_ids = pd.read_csv('amplitude_user_ids (1).csv')
+    search_events = load_cached('all_search_events (1).csv')
+    listing_views = load_cached('view_listing_detail_events (1).csv')
+    reservations = load_cached('reservations (1).csv')
+    user_ids = load_cached('amplitude_user_ids (1).csv')
     
-    # Convert date columns
-    search_events['event_time'] = pd.to_datetime(search_events['event_time'])
-    search_events['event_date'] = pd.to_datetime(search_events['event_date'])
-    
-    listing_views['event_time'] = pd.to_datetime(listing_views['event_time'])
-    listing_views['event_date'] = pd.to_datetime(listing_views['event_date'])
-    
-    reservations['created_at'] = pd.to_datetime(reservations['created_at'])
-    reservations['approved_at'] = pd.to_datetime(reservations['approved_at'])
-    reservations['successful_payment_collected_at'] = pd.to_datetime(reservations['successful_payment_collected_at'])
+    # Bulk-load settings: the database is rebuilt from the CSVs on every run,
+    # so durability of the intermediate writes does not matter
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-200000")
     
     # Write to database
-    search_events.to_sql('search_events', conn, if_exists='replace', index=False)
-    listing_views.to_sql('listing_views', conn, if_exists='replace', index=False)
-    reservations.to_sql('reservations', conn, if_exists='replace', index=False)
-    user_ids.to_sql('amplitude_user_ids', conn, if_exists='replace', index=False)
+    with conn:
+        search_events.to_sql('search_events', conn, if_exists='replace', index=False, chunksize=50_000)
+        listing_views.to_sql('listing_views', conn, if_exists='replace', index=False, chunksize=50_000)
+        reservations.to_sql('reservations', conn, if_exists='replace', index=False, chunksize=50_000)
+        user_ids.to_sql('amplitude_user_ids', conn, if_exists='replace', index=False, chunksize=50_000)
+    
+    # Shared schema step: reservation month, the cleaned (non-bot) event
+    # tables the analysis queries read, indexes and planner statistics
+    ensure_schema(conn, reloaded=True)
     
     print(f"Database created with {len(search_events):,} search events, {len(listing_views):,} listing views, {len(reservations):,} reservations")
     
     return conn
 
+def run_query(db_path, query):
+    """Run one query on its own read-only connection"""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute('PRAGMA query_only=1')
+        return pd.read_sql_query(query, conn)
+    finally:
+        conn.close()
+
 def run_sql_analysis(conn):
     """Run the comprehensive SQL analysis"""
     print("Running SQL analysis...")
@@ -74,37 +86,39 @@ def run_sql_analysis(conn):
     
     # Split into individual queries (simplified for SQLite)
     queries = [
-        # Basic funnel metrics
+        # Basic funnel metrics: collapse the bot-filtered events into one row
+        # per user with a flag per funnel stage, so each table is read once
         """
-        WITH cleaned_search_events AS (
-            SELECT * FROM search_events WHERE is_bot = 0
-        ),
-        cleaned_listing_views AS (
-            SELECT * FROM listing_views WHERE is_bot = 0
-        ),
-        cleaned_reservations AS (
-            SELECT * FROM reservations WHERE renter_user_id IS NOT NULL
+        WITH user_flags AS (
+            SELECT 
+                uid,
+                MAX(searched) AS searched,
+                MAX(viewed) AS viewed,
+                MAX(reserved) AS reserved,
+                MAX(paid) AS paid
+            FROM (
+                SELECT merged_amplitude_id AS uid, 1 AS searched, 0 AS viewed, 0 AS reserved, 0 AS paid
+                FROM cleaned_search_events
+                UNION ALL
+                SELECT merged_amplitude_id, 0, 1, 0, 0
+                FROM cleaned_listing_views
+                UNION ALL
+                SELECT renter_user_id, 0, 0, 1, successful_payment_collected_at IS NOT NULL
+                FROM cleaned_reservations
+            )
+            GROUP BY uid
         )
         SELECT 
             'FUNNEL_METRICS' AS analysis_type,
-            COUNT(DISTINCT s.merged_amplitude_id) AS total_searchers,
-            COUNT(DISTINCT l.merged_amplitude_id) AS total_viewers,
-            COUNT(DISTINCT r.renter_user_id) AS total_reservers,
-            COUNT(DISTINCT CASE WHEN r.successful_payment_collected_at IS NOT NULL 
-                               THEN r.renter_user_id END) AS total_payers
-        FROM cleaned_search_events s
-        LEFT JOIN cleaned_listing_views l ON s.merged_amplitude_id = l.merged_amplitude_id
-        LEFT JOIN cleaned_reservations r ON s.merged_amplitude_id = r.renter_user_id
+            SUM(searched) AS total_searchers,
+            SUM(searched AND viewed) AS total_viewers,
+            SUM(searched AND reserved) AS total_reservers,
+            SUM(searched AND paid) AS total_payers
+        FROM user_flags
         """,
         
         # Search type analysis
         """
-        WITH cleaned_search_events AS (
-            SELECT * FROM search_events WHERE is_bot = 0
-        ),
-        cleaned_listing_views AS (
-            SELECT * FROM listing_views WHERE is_bot = 0
-        )
         SELECT 
             'SEARCH_TYPE' AS analysis_type,
             s.search_type,
@@ -120,12 +134,6 @@ def run_sql_analysis(conn):
         
         # Attribution analysis
         """
-        WITH cleaned_search_events AS (
-            SELECT * FROM search_events WHERE is_bot = 0
-        ),
-        cleaned_listing_views AS (
-            SELECT * FROM listing_views WHERE is_bot = 0
-        )
         SELECT 
             'ATTRIBUTION' AS analysis_type,
             s.first_attribution_source,
@@ -142,29 +150,38 @@ def run_sql_analysis(conn):
         LIMIT 10
         """,
         
-        # Monthly trends
+        # Monthly trends (each table is aggregated to one row per month before
+        # the month-level results are joined)
         """
-        WITH cleaned_search_events AS (
-            SELECT * FROM search_events WHERE is_bot = 0
+        WITH monthly_searchers AS (
+            SELECT month, COUNT(DISTINCT merged_amplitude_id) AS unique_searchers
+            FROM cleaned_search_events
+            GROUP BY month
         ),
-        cleaned_listing_views AS (
-            SELECT * FROM listing_views WHERE is_bot = 0
+        monthly_viewers AS (
+            SELECT month, COUNT(DISTINCT merged_amplitude_id) AS unique_viewers
+            FROM cleaned_listing_views
+            GROUP BY month
         ),
-        cleaned_reservations AS (
-            SELECT * FROM reservations WHERE renter_user_id IS NOT NULL
+        monthly_reservers AS (
+            SELECT 
+                month,
+                COUNT(DISTINCT renter_user_id) AS unique_reservers,
+                COUNT(DISTINCT CASE WHEN successful_payment_collected_at IS NOT NULL 
+                                   THEN renter_user_id END) AS unique_payers
+            FROM cleaned_reservations
+            GROUP BY month
         )
         SELECT 
             'MONTHLY' AS analysis_type,
             s.month,
-            COUNT(DISTINCT s.merged_amplitude_id) AS unique_searchers,
-            COUNT(DISTINCT l.merged_amplitude_id) AS unique_viewers,
-            COUNT(DISTINCT r.renter_user_id) AS unique_reservers,
-            COUNT(DISTINCT CASE WHEN r.successful_payment_collected_at IS NOT NULL 
-                               THEN r.renter_user_id END) AS unique_payers
-        FROM cleaned_search_events s
-        LEFT JOIN cleaned_listing_views l ON s.month = l.month
-        LEFT JOIN cleaned_reservations r ON CAST(strftime('%m', r.created_at) AS INTEGER) = s.month
-        GROUP BY s.month
+            s.unique_searchers,
+            COALESCE(l.unique_viewers, 0) AS unique_viewers,
+            COALESCE(r.unique_reservers, 0) AS unique_reservers,
+            COALESCE(r.unique_payers, 0) AS unique_payers
+        FROM monthly_searchers s
+        LEFT JOIN monthly_viewers l USING (month)
+        LEFT JOIN monthly_reservers r USING (month)
         ORDER BY s.month
         """,
         
@@ -182,21 +199,31 @@ def run_sql_analysis(conn):
         """
     ]
     
-    # Execute queries and collect results
+    # The queries are independent, so run them concurrently on separate
+    # read-only connections (SQLite releases the GIL while it executes)
+    db_path = next(path for _, name, path in conn.execute("PRAGMA database_list") if name == 'main')
+    
     results = {}
-    for i, query in enumerate(queries):
-        try:
-            df = pd.read_sql_query(query, conn)
-            results[f'query_{i}'] = df
-            print(f"Query {i+1} completed: {len(df)} rows")
-        except Exception as e:
-            print(f"Error in query {i+1}: {e}")
+    with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+        futures = [executor.submit(run_query, db_path, query) for query in queries]
+        for i, future in enumerate(futures):
+            try:
+                df = future.result()
+                results[f'query_{i}'] = df
+                print(f"Query {i+1} completed: {len(df)} rows")
+            except Exception as e:
+                print(f"Error in query {i+1}: {e}")
     
     return results
 
-def create_visualizations(results):
-    """Create comprehensive visualizations from SQL results"""
+def create_visualizations(results, export=False):
+    """Create comprehensive visualizations from SQL results
+    
+    Charts are written at preview resolution unless export=True, which
+    renders them at print quality (300 dpi).
+    """
     print("Creating visualizations...")
+    dpi = 300 if export else 120
     
     # Set up the plotting environment
     plt.rcParams['figure.figsize'] = (15, 10)
@@ -241,9 +268,9 @@ def create_visualizations(results):
         for i, rate in enumerate(conversion_rates):
             ax2.text(i, rate + 1, f'{rate:.1f}%', ha='center', fontweight='bold')
         
-        plt.tight_layout()
-        plt.savefig('funnel_analysis.png', dpi=300, bbox_inches='tight')
-        plt.show()
+        fig.tight_layout()
+        fig.savefig('funnel_analysis.png', dpi=dpi, bbox_inches='tight')
+        plt.close(fig)
     
     # 2. Search Type Performance
     if 'query_1' in results and not results['query_1'].empty:
@@ -263,21 +290,21 @@ def create_visualizations(results):
         ax2.set_ylabel('Conversion Rate (%)')
         ax2.tick_params(axis='x', rotation=45)
         
-        plt.tight_layout()
-        plt.savefig('search_type_analysis.png', dpi=300, bbox_inches='tight')
-        plt.show()
+        fig.tight_layout()
+        fig.savefig('search_type_analysis.png', dpi=dpi, bbox_inches='tight')
+        plt.close(fig)
     
     # 3. Attribution Performance
     if 'query_2' in results and not results['query_2'].empty:
         attribution_data = results['query_2']
         
-        plt.figure(figsize=(12, 8))
-        attribution_data.set_index(['first_attribution_source', 'first_attribution_channel'])['unique_searchers'].plot(kind='barh')
-        plt.title('Top Attribution Sources by User Count')
-        plt.xlabel('Number of Unique Users')
-        plt.tight_layout()
-        plt.savefig('attribution_analysis.png', dpi=300, bbox_inches='tight')
-        plt.show()
+        fig, ax = plt.subplots(figsize=(12, 8))
+        attribution_data.set_index(['first_attribution_source', 'first_attribution_channel'])['unique_searchers'].plot(kind='barh', ax=ax)
+        ax.set_title('Top Attribution Sources by User Count')
+        ax.set_xlabel('Number of Unique Users')
+        fig.tight_layout()
+        fig.savefig('attribution_analysis.png', dpi=dpi, bbox_inches='tight')
+        plt.close(fig)
     
     # 4. Monthly Trends
     if 'query_3' in results and not results['query_3'].empty:
@@ -301,9 +328,9 @@ def create_visualizations(results):
         ax2.grid(True, alpha=0.3)
         ax2.set_xticks(monthly_data['month'])
         
-        plt.tight_layout()
-        plt.savefig('monthly_trends.png', dpi=300, bbox_inches='tight')
-        plt.show()
+        fig.tight_layout()
+        fig.savefig('monthly_trends.png', dpi=dpi, bbox_inches='tight')
+        plt.close(fig)
     
     # 5. Payment Analysis
     if 'query_4' in results and not results['query_4'].empty:
@@ -331,9 +358,9 @@ def create_visualizations(results):
         ax2.text(0, payment_data['payment_completion_rate'] + 1, 
                 f'{payment_data["payment_completion_rate"]:.1f}%', ha='center', fontweight='bold')
         
-        plt.tight_layout()
-        plt.savefig('payment_analysis.png', dpi=300, bbox_inches='tight')
-        plt.show()
+        fig.tight_layout()
+        fig.savefig('payment_analysis.png', dpi=dpi, bbox_inches='tight')
+        plt.close(fig)
 
 def generate_business_recommendations(results):
     """Generate data-driven business recommendations"""
@@ -422,9 +449,6 @@ def main():
         print(f"   Recommendation: {rec['recommendation']}")
         print(f"   Impact: {rec['impact']}")
     
-    # Close database connection
-    conn.close()
-    
     print("\n=== ANALYSIS COMPLETE ===")
     print("Visualizations saved as PNG files")
     print("SQL analysis completed successfully")
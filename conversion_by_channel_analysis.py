@@ -1,5 +1,6 @@
 import pandas as pd
 import numpy as np
+from csv_cache import load_cached
 
 def analyze_conversion_by_channel():
     """
@@ -8,81 +9,67 @@ def analyze_conversion_by_channel():
     
     # Read the data files
     print("Loading data files...")
-    search_events = pd.read_csv('all_search_events (1).csv')
-    click_events = pd.read_csv('view_listing_detail_events (1).csv')
-    reservations = pd.read_csv('reservations (1).csv')
+    search_events = load_cached('all_search_events (1).csv',
+                                columns=['merged_amplitude_id', 'first_attribution_channel'])
+    click_events = load_cached('view_listing_detail_events (1).csv', columns=['merged_amplitude_id'])
+    reservations = load_cached('reservations (1).csv', columns=['renter_user_id'])
     
     print(f"Loaded {len(search_events)} search events")
     print(f"Loaded {len(click_events)} click events")
     print(f"Loaded {len(reservations)} reservations")
     
-    # Convert timestamps to datetime
-    search_events['event_time'] = pd.to_datetime(search_events['event_time'])
-    click_events['event_time'] = pd.to_datetime(click_events['event_time'])
-    reservations['created_at'] = pd.to_datetime(reservations['created_at'])
-    
     # Get unique channels from search events
     channels = search_events['first_attribution_channel'].unique()
     print(f"\nFound {len(channels)} attribution channels: {list(channels)}")
     
-    # Create results dataframe
-    results = []
-    
-    for channel in channels:
-        print(f"\n=== Analyzing channel: {channel} ===")
-        
-        # Filter data for this channel
-        channel_searches = search_events[search_events['first_attribution_channel'] == channel]
-        channel_search_users = set(channel_searches['merged_amplitude_id'].unique())
-        
-        # Get clicks for users who came from this channel
-        channel_clicks = click_events[click_events['merged_amplitude_id'].isin(channel_search_users)]
-        channel_click_users = set(channel_clicks['merged_amplitude_id'].unique())
-        
-        # Get reservations for users who came from this channel
-        channel_reservations = reservations[reservations['renter_user_id'].isin(channel_search_users)]
-        channel_reserve_users = set(channel_reservations['renter_user_id'].unique())
-        
-        # Calculate metrics
-        total_searchers = len(channel_search_users)
-        total_clickers = len(channel_click_users)
-        total_reservers = len(channel_reserve_users)
-        
-        # Users who did both searched and clicked
-        searched_and_clicked = len(channel_search_users.intersection(channel_click_users))
-        
-        # Users who did searched, clicked, and reserved
-        searched_clicked_reserved = len(channel_search_users.intersection(channel_click_users).intersection(channel_reserve_users))
-        
-        # Calculate conversion rates
-        search_to_click_rate = (searched_and_clicked / total_searchers * 100) if total_searchers > 0 else 0
-        click_to_reserve_rate = (searched_clicked_reserved / searched_and_clicked * 100) if searched_and_clicked > 0 else 0
-        search_to_reserve_rate = (searched_clicked_reserved / total_searchers * 100) if total_searchers > 0 else 0
-        
-        # Store results
-        results.append({
-            'channel': channel,
-            'total_searchers': total_searchers,
-            'total_clickers': total_clickers,
-            'total_reservers': total_reservers,
-            'searched_and_clicked': searched_and_clicked,
-            'searched_clicked_reserved': searched_clicked_reserved,
-            'search_to_click_rate': search_to_click_rate,
-            'click_to_reserve_rate': click_to_reserve_rate,
-            'search_to_reserve_rate': search_to_reserve_rate
-        })
-        
-        print(f"Total searchers: {total_searchers:,}")
-        print(f"Total clickers: {total_clickers:,}")
-        print(f"Total reservers: {total_reservers:,}")
-        print(f"Searched and clicked: {searched_and_clicked:,}")
-        print(f"Searched, clicked, and reserved: {searched_clicked_reserved:,}")
-        print(f"Search to Click rate: {search_to_click_rate:.2f}%")
-        print(f"Click to Reserve rate: {click_to_reserve_rate:.2f}%")
-        print(f"Search to Reserve rate: {search_to_reserve_rate:.2f}%")
-    
-    # Create summary dataframe
-    results_df = pd.DataFrame(results)
+    # Users can arrive through several channels, so work on the distinct
+    # (user, channel) pairs and flag each pair's funnel progress once
+    click_users = click_events['merged_amplitude_id'].unique()
+    reserve_users = reservations['renter_user_id'].unique()
+    
+    # Searches without a channel belong to no channel's funnel (factorize
+    # would code them -1, which bincount rejects)
+    user_channels = (search_events[['merged_amplitude_id', 'first_attribution_channel']]
+                     .dropna(subset=['first_attribution_channel'])
+                     .drop_duplicates())
+    channel_codes, channel_names = pd.factorize(user_channels['first_attribution_channel'])
+    
+    # Encode each pair's funnel progress as a 2-bit stage (1 = clicked,
+    # 2 = reserved, 3 = both) and histogram the stages per channel in one pass
+    stage = (user_channels['merged_amplitude_id'].isin(click_users).to_numpy(dtype=np.int64)
+             | user_channels['merged_amplitude_id'].isin(reserve_users).to_numpy(dtype=np.int64) << 1)
+    stage_counts = np.bincount(channel_codes * 4 + stage, minlength=len(channel_names) * 4).reshape(-1, 4)
+    
+    results_df = pd.DataFrame({
+        'channel': channel_names,
+        'total_searchers': stage_counts.sum(axis=1),
+        'total_clickers': stage_counts[:, 1] + stage_counts[:, 3],
+        'total_reservers': stage_counts[:, 2] + stage_counts[:, 3],
+        'searched_clicked_reserved': stage_counts[:, 3]
+    })
+    
+    # Every clicker counted above is a searcher in the channel
+    results_df['searched_and_clicked'] = results_df['total_clickers']
+    
+    # Calculate conversion rates
+    results_df['search_to_click_rate'] = (results_df['searched_and_clicked'] / results_df['total_searchers'] * 100).fillna(0)
+    results_df['click_to_reserve_rate'] = (results_df['searched_clicked_reserved'] / results_df['searched_and_clicked'] * 100).fillna(0)
+    results_df['search_to_reserve_rate'] = (results_df['searched_clicked_reserved'] / results_df['total_searchers'] * 100).fillna(0)
+    
+    results_df = results_df[['channel', 'total_searchers', 'total_clickers', 'total_reservers',
+                             'searched_and_clicked', 'searched_clicked_reserved',
+                             'search_to_click_rate', 'click_to_reserve_rate', 'search_to_reserve_rate']]
+    
+    for _, row in results_df.iterrows():
+        print(f"\n=== Analyzing channel: {row['channel']} ===")
+        print(f"Total searchers: {row['total_searchers']:,}")
+        print(f"Total clickers: {row['total_clickers']:,}")
+        print(f"Total reservers: {row['total_reservers']:,}")
+        print(f"Searched and clicked: {row['searched_and_clicked']:,}")
+        print(f"Searched, clicked, and reserved: {row['searched_clicked_reserved']:,}")
+        print(f"Search to Click rate: {row['search_to_click_rate']:.2f}%")
+        print(f"Click to Reserve rate: {row['click_to_reserve_rate']:.2f}%")
+        print(f"Search to Reserve rate: {row['search_to_reserve_rate']:.2f}%")
     
     # Sort by search to reserve rate (overall conversion)
     results_df = results_df.sort_values('search_to_reserve_rate', ascending=False)
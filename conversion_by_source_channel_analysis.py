@@ -1,5 +1,6 @@
 import pandas as pd
 import numpy as np
+from csv_cache import load_cached
 
 def analyze_conversion_by_source_channel():
     """
@@ -8,87 +9,72 @@ def analyze_conversion_by_source_channel():
     
     # Read the data files
     print("Loading data files...")
-    search_events = pd.read_csv('all_search_events (1).csv')
-    click_events = pd.read_csv('view_listing_detail_events (1).csv')
-    reservations = pd.read_csv('reservations (1).csv')
+    # Only the columns this analysis touches are read from the cache
+    search_events = load_cached('all_search_events (1).csv', columns=[
+        'merged_amplitude_id', 'first_attribution_source', 'first_attribution_channel'])
+    click_events = load_cached('view_listing_detail_events (1).csv', columns=['merged_amplitude_id'])
+    reservations = load_cached('reservations (1).csv', columns=['renter_user_id'])
     
     print(f"Loaded {len(search_events)} search events")
     print(f"Loaded {len(click_events)} click events")
     print(f"Loaded {len(reservations)} reservations")
     
-    # Convert timestamps to datetime
-    search_events['event_time'] = pd.to_datetime(search_events['event_time'])
-    click_events['event_time'] = pd.to_datetime(click_events['event_time'])
-    reservations['created_at'] = pd.to_datetime(reservations['created_at'])
-    
-    # Create source-channel combinations
-    search_events['source_channel'] = search_events['first_attribution_source'] + ' - ' + search_events['first_attribution_channel']
-    
-    # Get unique source-channel combinations
-    source_channels = search_events['source_channel'].unique()
-    print(f"\nFound {len(source_channels)} source-channel combinations:")
-    for sc in sorted(source_channels):
-        count = len(search_events[search_events['source_channel'] == sc])
-        print(f"  {sc}: {count:,} searches")
-    
-    # Create results dataframe
-    results = []
-    
-    for source_channel in source_channels:
-        print(f"\n=== Analyzing: {source_channel} ===")
-        
-        # Filter data for this source-channel combination
-        sc_searches = search_events[search_events['source_channel'] == source_channel]
-        sc_search_users = set(sc_searches['merged_amplitude_id'].unique())
-        
-        # Get clicks for users who came from this source-channel
-        sc_clicks = click_events[click_events['merged_amplitude_id'].isin(sc_search_users)]
-        sc_click_users = set(sc_clicks['merged_amplitude_id'].unique())
-        
-        # Get reservations for users who came from this source-channel
-        sc_reservations = reservations[reservations['renter_user_id'].isin(sc_search_users)]
-        sc_reserve_users = set(sc_reservations['renter_user_id'].unique())
-        
-        # Calculate metrics
-        total_searchers = len(sc_search_users)
-        total_clickers = len(sc_click_users)
-        total_reservers = len(sc_reserve_users)
-        
-        # Users who did both searched and clicked
-        searched_and_clicked = len(sc_search_users.intersection(sc_click_users))
-        
-        # Users who did searched, clicked, and reserved
-        searched_clicked_reserved = len(sc_search_users.intersection(sc_click_users).intersection(sc_reserve_users))
-        
-        # Calculate conversion rates
-        search_to_click_rate = (searched_and_clicked / total_searchers * 100) if total_searchers > 0 else 0
-        click_to_reserve_rate = (searched_clicked_reserved / searched_and_clicked * 100) if searched_and_clicked > 0 else 0
-        search_to_reserve_rate = (searched_clicked_reserved / total_searchers * 100) if total_searchers > 0 else 0
-        
-        # Store results
-        results.append({
-            'source_channel': source_channel,
-            'total_searchers': total_searchers,
-            'total_clickers': total_clickers,
-            'total_reservers': total_reservers,
-            'searched_and_clicked': searched_and_clicked,
-            'searched_clicked_reserved': searched_clicked_reserved,
-            'search_to_click_rate': search_to_click_rate,
-            'click_to_reserve_rate': click_to_reserve_rate,
-            'search_to_reserve_rate': search_to_reserve_rate
-        })
-        
-        print(f"Total searchers: {total_searchers:,}")
-        print(f"Total clickers: {total_clickers:,}")
-        print(f"Total reservers: {total_reservers:,}")
-        print(f"Searched and clicked: {searched_and_clicked:,}")
-        print(f"Searched, clicked, and reserved: {searched_clicked_reserved:,}")
-        print(f"Search to Click rate: {search_to_click_rate:.2f}%")
-        print(f"Click to Reserve rate: {click_to_reserve_rate:.2f}%")
-        print(f"Search to Reserve rate: {search_to_reserve_rate:.2f}%")
-    
-    # Create summary dataframe
-    results_df = pd.DataFrame(results)
+    # Create source-channel combinations as a categorical: the label strings are
+    # built once per category pair, rows only carry integer codes
+    source = search_events['first_attribution_source'].astype('category').cat
+    channel = search_events['first_attribution_channel'].astype('category').cat
+    labels = [f"{src} - {chan}" for src in source.categories for chan in channel.categories]
+    codes = np.where((source.codes < 0) | (channel.codes < 0), -1,
+                     source.codes.astype(np.int32) * len(channel.categories) + channel.codes)
+    search_events['source_channel'] = pd.Categorical.from_codes(codes, labels).remove_unused_categories()
+    
+    # Searches per source-channel combination, counted in one pass
+    counts = search_events['source_channel'].value_counts(sort=False)
+    print(f"\nFound {len(counts)} source-channel combinations:")
+    print('\n'.join(f"  {sc}: {count:,} searches" for sc, count in sorted(counts.items())))
+    
+    # One row per (user, source-channel) pair, flagged by the user's later funnel steps
+    clicker_ids = click_events['merged_amplitude_id'].unique()
+    reserver_ids = reservations['renter_user_id'].unique()
+    searchers_df = search_events[['merged_amplitude_id', 'source_channel']].drop_duplicates()
+    searchers_df['is_clicker'] = searchers_df['merged_amplitude_id'].isin(clicker_ids)
+    searchers_df['is_reserver'] = searchers_df['merged_amplitude_id'].isin(reserver_ids)
+    searchers_df['is_both'] = searchers_df['is_clicker'] & searchers_df['is_reserver']
+    
+    # All combinations in one grouped pass, in first-seen order
+    results_df = searchers_df.groupby('source_channel', sort=False).agg(
+        total_searchers=('merged_amplitude_id', 'size'),
+        total_clickers=('is_clicker', 'sum'),
+        total_reservers=('is_reserver', 'sum'),
+        searched_clicked_reserved=('is_both', 'sum'),
+    ).reset_index()
+    
+    # Every clicker counted here also searched from this source-channel
+    results_df.insert(4, 'searched_and_clicked', results_df['total_clickers'])
+    
+    # Calculate conversion rates
+    searchers = results_df['total_searchers']
+    clicked = results_df['searched_and_clicked']
+    converted = results_df['searched_clicked_reserved']
+    results_df['search_to_click_rate'] = (clicked / searchers * 100).where(searchers > 0, 0)
+    results_df['click_to_reserve_rate'] = (converted / clicked * 100).where(clicked > 0, 0)
+    results_df['search_to_reserve_rate'] = (converted / searchers * 100).where(searchers > 0, 0)
+    
+    # Build the per-combination report and write it out in one go
+    report = []
+    for row in results_df.itertuples(index=False):
+        report += [
+            f"\n=== Analyzing: {row.source_channel} ===",
+            f"Total searchers: {row.total_searchers:,}",
+            f"Total clickers: {row.total_clickers:,}",
+            f"Total reservers: {row.total_reservers:,}",
+            f"Searched and clicked: {row.searched_and_clicked:,}",
+            f"Searched, clicked, and reserved: {row.searched_clicked_reserved:,}",
+            f"Search to Click rate: {row.search_to_click_rate:.2f}%",
+            f"Click to Reserve rate: {row.click_to_reserve_rate:.2f}%",
+            f"Search to Reserve rate: {row.search_to_reserve_rate:.2f}%",
+        ]
+    print('\n'.join(report))
     
     # Sort by search to reserve rate (overall conversion)
     results_df = results_df.sort_values('search_to_reserve_rate', ascending=False)
@@ -1,6 +1,25 @@
 import pandas as pd
+import numpy as np
 import sqlite3
 from datetime import datetime
+from csv_cache import load_cached
+
+def count_prior_events(events, reservations):
+    """
+    Number of a renter's events at or before each reservation's created_at.
+    reservations must be sorted by created_at; returns an int array aligned to it.
+    """
+    events = events.sort_values('event_time', kind='stable')
+    # Running per-user count, so the last event matched as-of a time is the total so far
+    events = events.assign(prior=events.groupby('merged_amplitude_id').cumcount() + 1)
+    matched = pd.merge_asof(
+        reservations[['renter_user_id', 'created_at']],
+        events[['merged_amplitude_id', 'event_time', 'prior']],
+        left_on='created_at', right_on='event_time',
+        left_by='renter_user_id', right_by='merged_amplitude_id',
+        direction='backward'
+    )
+    return matched['prior'].fillna(0).astype(int).to_numpy()
 
 def analyze_search_to_reservation_conversion():
     """
@@ -9,46 +28,43 @@ def analyze_search_to_reservation_conversion():
     
     # Read the data files
     print("Loading data files...")
-    search_events = pd.read_csv('all_search_events (1).csv')
-    click_events = pd.read_csv('view_listing_detail_events (1).csv')
-    reservations = pd.read_csv('reservations (1).csv')
+    # Only the columns this analysis touches are read from the cache
+    search_events = load_cached('all_search_events (1).csv', columns=['merged_amplitude_id', 'event_time'])
+    click_events = load_cached('view_listing_detail_events (1).csv', columns=['merged_amplitude_id', 'event_time'])
+    reservations = load_cached('reservations (1).csv', columns=['renter_user_id', 'created_at'])
     
     print(f"Loaded {len(search_events)} search events")
     print(f"Loaded {len(click_events)} click events")
     print(f"Loaded {len(reservations)} reservations")
     
-    # Convert timestamps to datetime for proper analysis
-    search_events['event_time'] = pd.to_datetime(search_events['event_time'])
-    click_events['event_time'] = pd.to_datetime(click_events['event_time'])
-    reservations['created_at'] = pd.to_datetime(reservations['created_at'])
+    # Sorted unique user IDs per funnel stage; intersections below are
+    # sorted merges on these arrays rather than Python set operations
+    searchers = np.unique(search_events['merged_amplitude_id'].dropna().to_numpy())
+    clickers = np.unique(click_events['merged_amplitude_id'].dropna().to_numpy())
+    reservers = np.unique(reservations['renter_user_id'].dropna().to_numpy())
     
     # Get unique users who searched
-    unique_searchers = search_events['merged_amplitude_id'].nunique()
+    unique_searchers = len(searchers)
     print(f"\n=== CONVERSION FUNNEL ANALYSIS ===")
     print(f"Total unique users who searched: {unique_searchers:,}")
     
     # Get unique users who clicked on listings
-    unique_clickers = click_events['merged_amplitude_id'].nunique()
+    unique_clickers = len(clickers)
     print(f"Total unique users who clicked on listings: {unique_clickers:,}")
     
     # Get unique users who made reservations
-    unique_reservers = reservations['renter_user_id'].nunique()
+    unique_reservers = len(reservers)
     print(f"Total unique users who made reservations: {unique_reservers:,}")
     
     # Find users who did the full funnel: searched → clicked → reserved
-    # First, get users who both searched and clicked
-    searchers = set(search_events['merged_amplitude_id'].unique())
-    clickers = set(click_events['merged_amplitude_id'].unique())
-    reservers = set(reservations['renter_user_id'].unique())
-    
     # Users who searched and clicked
-    searched_and_clicked = searchers.intersection(clickers)
+    searched_and_clicked = np.intersect1d(searchers, clickers, assume_unique=True)
     print(f"Users who both searched and clicked: {len(searched_and_clicked):,}")
     
     # Users who searched, clicked, and reserved
     # Note: We need to match amplitude_id from search/click events with renter_user_id from reservations
     # This assumes they are the same user identifier system
-    searched_clicked_reserved = searched_and_clicked.intersection(reservers)
+    searched_clicked_reserved = np.intersect1d(searched_and_clicked, reservers, assume_unique=True)
     print(f"Users who searched, clicked, AND reserved: {len(searched_clicked_reserved):,}")
     
     # Calculate conversion rates
@@ -64,41 +80,19 @@ def analyze_search_to_reservation_conversion():
     # More detailed analysis: Track the actual funnel with timestamps
     print(f"\n=== DETAILED FUNNEL ANALYSIS ===")
     
-    # Create a more sophisticated analysis that tracks the sequence
-    funnel_users = []
-    
-    # For each user who made a reservation, check if they searched and clicked before reserving
-    for _, reservation in reservations.iterrows():
-        user_id = reservation['renter_user_id']
-        reservation_time = reservation['created_at']
-        
-        # Check if this user searched before the reservation
-        user_searches = search_events[
-            (search_events['merged_amplitude_id'] == user_id) & 
-            (search_events['event_time'] <= reservation_time)
-        ]
-        
-        # Check if this user clicked on listings before the reservation
-        user_clicks = click_events[
-            (click_events['merged_amplitude_id'] == user_id) & 
-            (click_events['event_time'] <= reservation_time)
-        ]
-        
-        if len(user_searches) > 0 and len(user_clicks) > 0:
-            funnel_users.append({
-                'user_id': user_id,
-                'searches': len(user_searches),
-                'clicks': len(user_clicks),
-                'reservation_time': reservation_time,
-                'listing_id': reservation['listing_id']
-            })
+    # Count each user's searches and clicks at or before every reservation
+    # with as-of joins instead of re-filtering the event tables per reservation
+    funnel = reservations.sort_values('created_at', kind='stable')
+    funnel['searches'] = count_prior_events(search_events, funnel)
+    funnel['clicks'] = count_prior_events(click_events, funnel)
+    funnel = funnel[(funnel['searches'] > 0) & (funnel['clicks'] > 0)]
     
-    print(f"Users who completed the full funnel (searched -> clicked -> reserved): {len(funnel_users):,}")
+    print(f"Users who completed the full funnel (searched -> clicked -> reserved): {len(funnel):,}")
     
     # Additional insights
-    if funnel_users:
-        avg_searches_per_funnel_user = sum(f['searches'] for f in funnel_users) / len(funnel_users)
-        avg_clicks_per_funnel_user = sum(f['clicks'] for f in funnel_users) / len(funnel_users)
+    if len(funnel) > 0:
+        avg_searches_per_funnel_user = funnel['searches'].mean()
+        avg_clicks_per_funnel_user = funnel['clicks'].mean()
         
         print(f"\n=== FUNNEL USER INSIGHTS ===")
         print(f"Average searches per funnel user: {avg_searches_per_funnel_user:.2f}")
@@ -110,7 +104,7 @@ def analyze_search_to_reservation_conversion():
         'total_reservers': unique_reservers,
         'searched_and_clicked': len(searched_and_clicked),
         'searched_clicked_reserved': len(searched_clicked_reserved),
-        'funnel_users': len(funnel_users),
+        'funnel_users': len(funnel),
         'search_to_click_rate': search_to_click_rate,
         'click_to_reserve_rate': click_to_reserve_rate,
         'search_to_reserve_rate': search_to_reserve_rate
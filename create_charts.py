@@ -7,12 +7,17 @@ This script creates various charts and visualizations to analyze the marketplace
 """
 
 import sqlite3
-import csv
+import matplotlib
+matplotlib.use('Agg')  # charts are only written to PNG; no GUI backend
 import matplotlib.pyplot as plt
 import seaborn as sns
 import numpy as np
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+import io
 import os
+from db import ensure_schema, load_csv_table
 
 # Set up plotting style
 plt.style.use('default')
@@ -24,56 +29,37 @@ def create_database():
         print("Creating database from CSV files...")
         
         conn = sqlite3.connect('marketplace_analysis.db')
+        # Bulk-load settings: no per-commit fsync, sort/temp space in memory
+        conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=OFF;
+            PRAGMA temp_store=MEMORY;
+            PRAGMA cache_size=-200000;
+        """)
         
-        # Load search events
-        with open('all_search_events (1).csv', 'r', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            headers = next(reader)
-            
-            conn.execute('DROP TABLE IF EXISTS search_events')
-            conn.execute('CREATE TABLE search_events (' + ','.join([f'{h} TEXT' for h in headers]) + ')')
-            
-            for row in reader:
-                conn.execute('INSERT INTO search_events VALUES (' + ','.join(['?' for _ in headers]) + ')', row)
+        tables = [
+            ('all_search_events (1).csv', 'search_events'),
+            ('view_listing_detail_events (1).csv', 'listing_views'),
+            ('reservations (1).csv', 'reservations'),
+            ('amplitude_user_ids (1).csv', 'amplitude_user_ids'),
+        ]
         
-        # Load listing views
-        with open('view_listing_detail_events (1).csv', 'r', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            headers = next(reader)
-            
-            conn.execute('DROP TABLE IF EXISTS listing_views')
-            conn.execute('CREATE TABLE listing_views (' + ','.join([f'{h} TEXT' for h in headers]) + ')')
-            
-            for row in reader:
-                conn.execute('INSERT INTO listing_views VALUES (' + ','.join(['?' for _ in headers]) + ')', row)
+        for csv_path, table in tables:
+            load_csv_table(conn, csv_path, table)
         
-        # Load reservations
-        with open('reservations (1).csv', 'r', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            headers = next(reader)
-            
-            conn.execute('DROP TABLE IF EXISTS reservations')
-            conn.execute('CREATE TABLE reservations (' + ','.join([f'{h} TEXT' for h in headers]) + ')')
-            
-            for row in reader:
-                conn.execute('INSERT INTO reservations VALUES (' + ','.join(['?' for _ in headers]) + ')', row)
+        # Shared derived tables and indexes, including the ones the chart queries use
+        ensure_schema(conn, reloaded=True)
         
-        # Load user IDs
-        with open('amplitude_user_ids (1).csv', 'r', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            headers = next(reader)
-            
-            conn.execute('DROP TABLE IF EXISTS amplitude_user_ids')
-            conn.execute('CREATE TABLE amplitude_user_ids (' + ','.join([f'{h} TEXT' for h in headers]) + ')')
-            
-            for row in reader:
-                conn.execute('INSERT INTO amplitude_user_ids VALUES (' + ','.join(['?' for _ in headers]) + ')', row)
-        
-        conn.commit()
         conn.close()
         print("Database created successfully!")
     else:
         print("Database already exists!")
+        
+        # Convert an older or shipped file (text True/False flags) before the
+        # chart workers query it with is_bot = 0
+        conn = sqlite3.connect('marketplace_analysis.db')
+        ensure_schema(conn)
+        conn.close()
 
 def get_data(conn, query):
     """Execute query and return results"""
@@ -85,25 +71,21 @@ def create_conversion_funnel_chart(conn):
     print("Creating conversion funnel chart...")
     
     # Get funnel metrics
+    # One pass over the distinct non-bot searchers, each checked against the
+    # later stages by indexed membership lookups rather than a fanned-out join
     query = """
-    WITH cleaned_search_events AS (
-        SELECT * FROM search_events WHERE is_bot = 'False'
-    ),
-    cleaned_listing_views AS (
-        SELECT * FROM listing_views WHERE is_bot = 'False'
-    ),
-    cleaned_reservations AS (
-        SELECT * FROM reservations WHERE renter_user_id IS NOT NULL
+    WITH searchers AS (
+        SELECT DISTINCT merged_amplitude_id AS user_id
+        FROM search_events
+        WHERE is_bot = 0 AND merged_amplitude_id IS NOT NULL
     )
     SELECT 
-        COUNT(DISTINCT s.merged_amplitude_id) AS total_searchers,
-        COUNT(DISTINCT l.merged_amplitude_id) AS total_viewers,
-        COUNT(DISTINCT r.renter_user_id) AS total_reservers,
-        COUNT(DISTINCT CASE WHEN r.successful_payment_collected_at IS NOT NULL 
-                           THEN r.renter_user_id END) AS total_payers
-    FROM cleaned_search_events s
-    LEFT JOIN cleaned_listing_views l ON s.merged_amplitude_id = l.merged_amplitude_id
-    LEFT JOIN cleaned_reservations r ON s.merged_amplitude_id = r.renter_user_id
+        COUNT(*) AS total_searchers,
+        COALESCE(SUM(user_id IN (SELECT merged_amplitude_id FROM listing_views WHERE is_bot = 0)), 0) AS total_viewers,
+        COALESCE(SUM(user_id IN (SELECT renter_user_id FROM reservations)), 0) AS total_reservers,
+        COALESCE(SUM(user_id IN (SELECT renter_user_id FROM reservations
+                                 WHERE successful_payment_collected_at IS NOT NULL)), 0) AS total_payers
+    FROM searchers
     """
     
     result = get_data(conn, query)[0]
@@ -146,8 +128,8 @@ def create_conversion_funnel_chart(conn):
         ax2.text(i, rate + 1, f'{rate:.1f}%', ha='center', fontweight='bold')
     
     plt.tight_layout()
-    plt.savefig('conversion_funnel.png', dpi=300, bbox_inches='tight')
-    plt.show()
+    fig.savefig('conversion_funnel.png', dpi=300, bbox_inches='tight')
+    plt.close(fig)
     
     print(f"Conversion Funnel Results:")
     print(f"• Searchers: {searchers:,}")
@@ -166,7 +148,7 @@ def create_search_type_chart(conn):
         COUNT(*) as count,
         COUNT(DISTINCT merged_amplitude_id) as unique_users
     FROM search_events 
-    WHERE is_bot = 'False'
+    WHERE is_bot = 0
     GROUP BY search_type
     ORDER BY count DESC
     """
@@ -200,8 +182,8 @@ def create_search_type_chart(conn):
         ax2.text(i, users + max(unique_users)*0.01, f'{users:,}', ha='center', fontweight='bold')
     
     plt.tight_layout()
-    plt.savefig('search_type_analysis.png', dpi=300, bbox_inches='tight')
-    plt.show()
+    fig.savefig('search_type_analysis.png', dpi=300, bbox_inches='tight')
+    plt.close(fig)
 
 def create_geographic_chart(conn):
     """Create geographic analysis chart"""
@@ -212,7 +194,7 @@ def create_geographic_chart(conn):
         search_dma,
         COUNT(DISTINCT merged_amplitude_id) as unique_searchers
     FROM search_events 
-    WHERE is_bot = 'False' AND search_dma IS NOT NULL
+    WHERE is_bot = 0 AND search_dma IS NOT NULL
     GROUP BY search_dma
     ORDER BY unique_searchers DESC
     LIMIT 15
@@ -223,7 +205,7 @@ def create_geographic_chart(conn):
     dmas = [row[0] for row in result]
     searchers = [row[1] for row in result]
     
-    plt.figure(figsize=(12, 8))
+    fig = plt.figure(figsize=(12, 8))
     bars = plt.barh(dmas, searchers, color='lightgreen')
     plt.title('Top 15 DMAs by Search Volume')
     plt.xlabel('Number of Unique Searchers')
@@ -234,8 +216,8 @@ def create_geographic_chart(conn):
                 f'{value:,}', va='center', fontweight='bold')
     
     plt.tight_layout()
-    plt.savefig('geographic_analysis.png', dpi=300, bbox_inches='tight')
-    plt.show()
+    fig.savefig('geographic_analysis.png', dpi=300, bbox_inches='tight')
+    plt.close(fig)
 
 def create_attribution_chart(conn):
     """Create attribution source analysis chart"""
@@ -247,7 +229,7 @@ def create_attribution_chart(conn):
         first_attribution_channel,
         COUNT(DISTINCT merged_amplitude_id) as unique_users
     FROM search_events 
-    WHERE is_bot = 'False' AND first_attribution_source IS NOT NULL
+    WHERE is_bot = 0 AND first_attribution_source IS NOT NULL
     GROUP BY first_attribution_source, first_attribution_channel
     HAVING COUNT(DISTINCT merged_amplitude_id) >= 50
     ORDER BY unique_users DESC
@@ -259,7 +241,7 @@ def create_attribution_chart(conn):
     labels = [f"{row[0]} - {row[1]}" for row in result]
     users = [row[2] for row in result]
     
-    plt.figure(figsize=(12, 8))
+    fig = plt.figure(figsize=(12, 8))
     bars = plt.barh(labels, users, color='lightblue')
     plt.title('Top Attribution Sources by User Count')
     plt.xlabel('Number of Unique Users')
@@ -270,8 +252,8 @@ def create_attribution_chart(conn):
                 f'{value:,}', va='center', fontweight='bold')
     
     plt.tight_layout()
-    plt.savefig('attribution_analysis.png', dpi=300, bbox_inches='tight')
-    plt.show()
+    fig.savefig('attribution_analysis.png', dpi=300, bbox_inches='tight')
+    plt.close(fig)
 
 def create_monthly_trends_chart(conn):
     """Create monthly trends chart"""
@@ -283,7 +265,7 @@ def create_monthly_trends_chart(conn):
         COUNT(DISTINCT merged_amplitude_id) as unique_searchers,
         COUNT(*) as total_searches
     FROM search_events 
-    WHERE is_bot = 'False'
+    WHERE is_bot = 0
     GROUP BY month
     ORDER BY month
     """
@@ -320,8 +302,8 @@ def create_monthly_trends_chart(conn):
         ax2.text(months[i], value + max(searches)*0.02, f'{value:,}', ha='center', fontweight='bold')
     
     plt.tight_layout()
-    plt.savefig('monthly_trends.png', dpi=300, bbox_inches='tight')
-    plt.show()
+    fig.savefig('monthly_trends.png', dpi=300, bbox_inches='tight')
+    plt.close(fig)
 
 def create_payment_analysis_chart(conn):
     """Create payment analysis chart"""
@@ -360,8 +342,8 @@ def create_payment_analysis_chart(conn):
     ax2.text(0, completion_rate + 1, f'{completion_rate:.1f}%', ha='center', fontweight='bold')
     
     plt.tight_layout()
-    plt.savefig('payment_analysis.png', dpi=300, bbox_inches='tight')
-    plt.show()
+    fig.savefig('payment_analysis.png', dpi=300, bbox_inches='tight')
+    plt.close(fig)
     
     print(f"Payment Analysis Results:")
     print(f"• Total reservations: {total:,}")
@@ -380,7 +362,7 @@ def create_search_terms_chart(conn):
         COUNT(*) as count,
         COUNT(DISTINCT merged_amplitude_id) as unique_users
     FROM search_events 
-    WHERE is_bot = 'False' AND search_term_category IS NOT NULL
+    WHERE is_bot = 0 AND search_term_category IS NOT NULL
     GROUP BY search_term_category
     ORDER BY count DESC
     """
@@ -414,8 +396,18 @@ def create_search_terms_chart(conn):
         ax2.text(i, users + max(unique_users)*0.01, f'{users:,}', ha='center', fontweight='bold')
     
     plt.tight_layout()
-    plt.savefig('search_terms_analysis.png', dpi=300, bbox_inches='tight')
-    plt.show()
+    fig.savefig('search_terms_analysis.png', dpi=300, bbox_inches='tight')
+    plt.close(fig)
+
+def render_chart(chart_fn, db_path='marketplace_analysis.db'):
+    """Run one chart function on its own connection and return what it printed"""
+    conn = sqlite3.connect(db_path)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            chart_fn(conn)
+    finally:
+        conn.close()
+    return output.getvalue()
 
 def main():
     """Main function to create all charts"""
@@ -426,18 +418,22 @@ def main():
     # Create database if needed
     create_database()
     
-    # Connect to database
-    conn = sqlite3.connect('marketplace_analysis.db')
+    chart_fns = [
+        create_conversion_funnel_chart,
+        create_search_type_chart,
+        create_geographic_chart,
+        create_attribution_chart,
+        create_monthly_trends_chart,
+        create_payment_analysis_chart,
+        create_search_terms_chart,
+    ]
     
     try:
-        # Create all charts
-        create_conversion_funnel_chart(conn)
-        create_search_type_chart(conn)
-        create_geographic_chart(conn)
-        create_attribution_chart(conn)
-        create_monthly_trends_chart(conn)
-        create_payment_analysis_chart(conn)
-        create_search_terms_chart(conn)
+        # The charts share no data, so render them in separate processes
+        # (pyplot is not thread-safe) and print their output in the usual order
+        with ProcessPoolExecutor(max_workers=min(4, os.cpu_count() or 1)) as pool:
+            for output in pool.map(render_chart, chart_fns):
+                print(output, end='')
         
         print("\n" + "=" * 60)
         print("✅ ALL CHARTS CREATED SUCCESSFULLY!")
@@ -453,9 +449,6 @@ def main():
         
     except Exception as e:
         print(f"❌ Error creating charts: {str(e)}")
-    
-    finally:
-        conn.close()
 
 if __name__ == "__main__":
     main()
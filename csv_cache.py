@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+CSV Loading with a Parquet Cache
+================================
+
+Parses each raw CSV export once and keeps a typed Parquet copy next to it,
+so later runs skip CSV parsing and date conversion entirely.
+"""
+
+import os
+import pandas as pd
+
+# How each export is parsed, so every script gets identically typed frames;
+# explicit timestamp formats skip per-column format inference
+CSV_READ_OPTIONS = {
+    'all_search_events (1).csv': {
+        'parse_dates': ['event_time', 'event_date'],
+        'date_format': {'event_time': '%Y-%m-%d %H:%M:%S', 'event_date': '%Y-%m-%d'},
+        'dtype': {'is_bot': 'bool'},
+    },
+    'view_listing_detail_events (1).csv': {
+        'parse_dates': ['event_time', 'event_date'],
+        'date_format': {'event_time': '%Y-%m-%d %H:%M:%S.%f', 'event_date': '%Y-%m-%d'},
+        'dtype': {'is_bot': 'bool'},
+    },
+    'reservations (1).csv': {
+        'parse_dates': ['created_at', 'approved_at', 'successful_payment_collected_at'],
+        'date_format': '%Y-%m-%d %H:%M:%S.%f',
+    },
+    'amplitude_user_ids (1).csv': {},
+}
+
+def load_cached(csv_path, columns=None):
+    """Load a CSV export, using its Parquet cache when it is up to date"""
+    parquet_path = csv_path + '.parquet'
+
+    if os.path.exists(parquet_path) and os.path.getmtime(parquet_path) >= os.path.getmtime(csv_path):
+        try:
+            # Columnar read: unrequested columns are never loaded
+            return pd.read_parquet(parquet_path, columns=columns)
+        except ImportError:
+            pass
+
+    df = pd.read_csv(csv_path, **CSV_READ_OPTIONS.get(csv_path, {}))
+    try:
+        df.to_parquet(parquet_path, compression='zstd', index=False)
+    except ImportError:
+        # No Parquet engine installed; carry on without a cache
+        pass
+
+    return df[columns] if columns is not None else df
+
+def iter_cached(csv_path, chunk_rows=100_000):
+    """Yield a CSV export as DataFrames of at most chunk_rows rows"""
+    parquet_path = csv_path + '.parquet'
+
+    if os.path.exists(parquet_path) and os.path.getmtime(parquet_path) >= os.path.getmtime(csv_path):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            pass
+        else:
+            # Stream row batches, so only one chunk is held as a DataFrame at a time
+            for batch in pq.ParquetFile(parquet_path).iter_batches(batch_size=chunk_rows):
+                yield batch.to_pandas()
+            return
+
+    # No usable cache yet: parse once (writing the cache) and slice the frame
+    df = load_cached(csv_path)
+    for start in range(0, max(len(df), 1), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
@@ -1,7 +1,9 @@
 import pandas as pd
+import matplotlib
+matplotlib.use('Agg')  # charts are only written to PNG; no GUI backend
 import matplotlib.pyplot as plt
-import sqlite3
 import numpy as np
+from db import ensure_schema, get_conn
 from datetime import datetime
 
 def create_day_of_week_conversion_chart():
@@ -9,56 +11,50 @@ def create_day_of_week_conversion_chart():
     Create a chart showing conversion rates by day of the week.
     """
     
-    # Connect to database
-    conn = sqlite3.connect('marketplace_analysis.db')
+    # Shared memory-mapped connection
+    conn = get_conn()
+    ensure_schema(conn)
     
     print("Loading data for day of week conversion analysis...")
     
-    # Load data
-    search_events = pd.read_sql_query("SELECT * FROM search_events WHERE is_bot = 'False'", conn)
-    click_events = pd.read_sql_query("SELECT * FROM listing_views WHERE is_bot = 'False'", conn)
-    reservations = pd.read_sql_query("SELECT * FROM reservations", conn)
-    
-    # Convert timestamps
-    search_events['event_time'] = pd.to_datetime(search_events['event_time'])
-    click_events['event_time'] = pd.to_datetime(click_events['event_time'])
-    reservations['created_at'] = pd.to_datetime(reservations['created_at'])
-    
-    # Extract day of week
-    search_events['day_of_week'] = search_events['event_time'].dt.day_name()
+    # Per-day searcher and converter counts, computed in SQL: the full-funnel
+    # users are the intersection of searchers, clickers and reservers
+    query = """
+    WITH funnel_users AS (
+        SELECT merged_amplitude_id FROM search_events WHERE is_bot = 0
+        INTERSECT
+        SELECT merged_amplitude_id FROM listing_views WHERE is_bot = 0
+        INTERSECT
+        SELECT renter_user_id FROM reservations
+    )
+    SELECT 
+        CAST(strftime('%w', event_time) AS INTEGER) AS weekday,
+        COUNT(DISTINCT merged_amplitude_id) AS total_searchers,
+        COUNT(DISTINCT CASE WHEN merged_amplitude_id IN funnel_users
+                            THEN merged_amplitude_id END) AS funnel_users
+    FROM search_events
+    WHERE is_bot = 0 AND event_time IS NOT NULL
+    GROUP BY weekday
+    """
+    day_counts = pd.read_sql_query(query, conn)
     
-    # Get users who completed the full funnel
-    searchers = set(search_events['merged_amplitude_id'].unique())
-    clickers = set(click_events['merged_amplitude_id'].unique())
-    reservers = set(reservations['renter_user_id'].unique())
-    funnel_users = searchers.intersection(clickers).intersection(reservers)
+    # strftime('%w') numbers days from Sunday = 0
+    weekday_names = ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
+    day_counts['day_of_week'] = day_counts['weekday'].map(dict(enumerate(weekday_names)))
     
-    # Analyze by day of week
+    # Analyze by day of week, in calendar order with empty days as zero
     days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-    day_data = []
-    
-    for day in days:
-        # Get searches for this day
-        day_searches = search_events[search_events['day_of_week'] == day]
-        day_users = set(day_searches['merged_amplitude_id'].unique())
-        
-        # Calculate metrics
-        total_searchers = len(day_users)
-        funnel_users_in_day = len(day_users.intersection(funnel_users))
-        conversion_rate = (funnel_users_in_day / total_searchers * 100) if total_searchers > 0 else 0
-        
-        day_data.append({
-            'day_of_week': day,
-            'total_searchers': total_searchers,
-            'funnel_users': funnel_users_in_day,
-            'conversion_rate': conversion_rate
-        })
-    
-    # Create DataFrame
-    day_df = pd.DataFrame(day_data)
+    day_df = (day_counts.set_index('day_of_week')
+              .reindex(days, fill_value=0)[['total_searchers', 'funnel_users']]
+              .astype('int64')
+              .rename_axis('day_of_week')
+              .reset_index())
+    # Days without searchers (or no rows at all) get a 0% rate, not a division by zero
+    searchers = day_df['total_searchers']
+    day_df['conversion_rate'] = (day_df['funnel_users'] / searchers.where(searchers > 0) * 100).fillna(0.0)
     
     # Create the chart
-    plt.figure(figsize=(12, 8))
+    fig = plt.figure(figsize=(12, 8))
     
     # Create bar chart
     colors = ['#FF6B6B', '#4ECDC4', '#45B7D1', '#96CEB4', '#FFEAA7', '#DDA0DD', '#98D8C8']
@@ -85,11 +81,11 @@ def create_day_of_week_conversion_chart():
     plt.tight_layout()
     
     # Save the chart
-    plt.savefig('day_of_week_conversion_chart.png', dpi=300, bbox_inches='tight')
+    fig.savefig('day_of_week_conversion_chart.png', dpi=300, bbox_inches='tight')
     print("Chart saved as 'day_of_week_conversion_chart.png'")
     
-    # Show the chart
-    plt.show()
+    # Release the figure
+    plt.close(fig)
     
     # Print summary table
     print("\n" + "="*60)
@@ -135,8 +131,6 @@ def create_day_of_week_conversion_chart():
         print(f"  - Conversion Rate: {row['conversion_rate']:.2f}%")
         print()
     
-    conn.close()
-    
     return day_df
 
 if __name__ == "__main__":
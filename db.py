@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Shared Database Connection and Schema
+=====================================
+
+One cached SQLite connection to the analysis database per process, opened
+in WAL mode with memory-mapped reads and in-memory temp storage for the
+analytical scans, plus a Parquet cache for query results that several
+scripts load.
+
+Every script that builds marketplace_analysis.db finishes with
+ensure_schema(), so the column types, derived tables and indexes are the
+same whichever builder ran last.
+"""
+
+import csv
+import functools
+import hashlib
+import os
+import sqlite3
+
+DB_PATH = 'marketplace_analysis.db'
+CACHE_DIR = '.cache'
+
+RAW_TABLES = ['search_events', 'listing_views', 'reservations', 'amplitude_user_ids']
+
+# True/False export columns, stored as 0/1 so every script filters with is_bot = 0
+FLAG_COLUMNS = {'is_bot', 'is_host', 'is_neighbor_office', 'is_lehi_centerpoint_latlng',
+                'is_usa_canada', 'is_listing_reserved'}
+
+# Columns stored as INTEGER by every builder: the flags, the user ID join keys
+# and the event month; all other columns keep the type their loader gave them
+INTEGER_COLUMNS = FLAG_COLUMNS | {'merged_amplitude_id', 'renter_user_id', 'host_user_id',
+                                  'amplitude_id', 'month'}
+
+# Narrow non-bot copies of the raw tables that the SQL analyses read
+DERIVED_TABLES = {
+    'cleaned_search_events': """
+        CREATE TABLE cleaned_search_events AS
+        SELECT merged_amplitude_id, search_id, search_type,
+               first_attribution_source, first_attribution_channel, month
+        FROM search_events WHERE is_bot = 0""",
+    'cleaned_listing_views': """
+        CREATE TABLE cleaned_listing_views AS
+        SELECT merged_amplitude_id, search_id, month
+        FROM listing_views WHERE is_bot = 0""",
+    'cleaned_reservations': """
+        CREATE TABLE cleaned_reservations AS
+        SELECT renter_user_id, successful_payment_collected_at, month
+        FROM reservations WHERE renter_user_id IS NOT NULL""",
+}
+
+# Bot filter and join keys of the funnel and SQL analyses (covering where the
+# lookup reads more than the key), plus the month columns
+INDEXES = {
+    'idx_search_bot_user': 'CREATE INDEX IF NOT EXISTS idx_search_bot_user ON search_events(is_bot, merged_amplitude_id)',
+    'idx_listing_bot_user': 'CREATE INDEX IF NOT EXISTS idx_listing_bot_user ON listing_views(is_bot, merged_amplitude_id)',
+    'idx_listing_bot_search': 'CREATE INDEX IF NOT EXISTS idx_listing_bot_search ON listing_views(is_bot, search_id, merged_amplitude_id)',
+    'idx_res_renter_paid': 'CREATE INDEX IF NOT EXISTS idx_res_renter_paid ON reservations(renter_user_id, successful_payment_collected_at)',
+    'idx_res_listing': 'CREATE INDEX IF NOT EXISTS idx_res_listing ON reservations(listing_id, renter_user_id, successful_payment_collected_at)',
+    'idx_search_month': 'CREATE INDEX IF NOT EXISTS idx_search_month ON search_events(month)',
+    'idx_lv_month': 'CREATE INDEX IF NOT EXISTS idx_lv_month ON listing_views(month)',
+    'idx_res_month': 'CREATE INDEX IF NOT EXISTS idx_res_month ON reservations(month)',
+    'idx_clv_search': 'CREATE INDEX IF NOT EXISTS idx_clv_search ON cleaned_listing_views(search_id)',
+}
+
+# How the CSV text of an INTEGER column is stored
+CSV_INTEGER_VALUES = {'True': 1, 'False': 0, '': None}
+
+# Flag values as read from either layout (0/1, or text from an unconverted database)
+FLAG_BOOLS = {1: True, 0: False, 'True': True, 'False': False}
+
+@functools.lru_cache(maxsize=None)
+def get_conn(path=DB_PATH):
+    """Return the shared connection for path (callers should not close it)"""
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA mmap_size=268435456')
+    conn.execute('PRAGMA cache_size=-200000')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    return conn
+
+def load_csv_table(conn, csv_path, table):
+    """Replace table with the rows of a CSV export, typed as INTEGER_COLUMNS says"""
+    with open(csv_path, 'r', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        headers = next(reader)
+        
+        columns = [f'{h} INTEGER' if h in INTEGER_COLUMNS else f'{h} TEXT' for h in headers]
+        integer_positions = [i for i, h in enumerate(headers) if h in INTEGER_COLUMNS]
+        
+        def convert(row):
+            for i in integer_positions:
+                row[i] = CSV_INTEGER_VALUES.get(row[i], row[i])
+            return row
+        
+        # One transaction per table, rows bound in bulk straight from the reader
+        with conn:
+            conn.execute(f'DROP TABLE IF EXISTS {table}')
+            conn.execute(f'CREATE TABLE {table} (' + ','.join(columns) + ')')
+            conn.executemany(f'INSERT INTO {table} VALUES (' + ','.join(['?' for _ in headers]) + ')',
+                             map(convert, reader))
+
+def convert_integer_columns(conn, table):
+    """Rebuild table with INTEGER_COLUMNS stored as integers, if any were text; returns whether it did"""
+    columns = [(name, decl) for _, name, decl, *_ in conn.execute(f'PRAGMA table_info({table})')]
+    if all(decl.upper() == 'INTEGER' for name, decl in columns if name in INTEGER_COLUMNS):
+        return False
+    
+    definitions, values = [], []
+    for name, decl in columns:
+        if name in INTEGER_COLUMNS:
+            definitions.append(f'{name} INTEGER')
+            if name in FLAG_COLUMNS:
+                values.append(f"CASE {name} WHEN 'True' THEN 1 WHEN 'False' THEN 0 ELSE NULLIF({name}, '') END")
+            else:
+                # INTEGER affinity turns numeric text into integers on insert
+                values.append(f"NULLIF({name}, '')")
+        else:
+            definitions.append(f'{name} {decl}'.rstrip())
+            values.append(name)
+    
+    # Indexes go with the old table; ensure_schema recreates them
+    with conn:
+        conn.execute(f'DROP TABLE IF EXISTS {table}_retyped')
+        conn.execute(f'CREATE TABLE {table}_retyped (' + ','.join(definitions) + ')')
+        conn.execute(f'INSERT INTO {table}_retyped SELECT ' + ','.join(values) + f' FROM {table}')
+        conn.execute(f'DROP TABLE {table}')
+        conn.execute(f'ALTER TABLE {table}_retyped RENAME TO {table}')
+    return True
+
+def ensure_schema(conn, reloaded=False):
+    """Bring the database to the shared layout: INTEGER key columns, the
+    reservation month, the cleaned_* tables and the shared indexes.
+    
+    Databases written with text flags (older builds, simple_sql) are converted
+    once. Builders pass reloaded=True after replacing the raw tables so the
+    cleaned_* copies are rebuilt from the new data.
+    """
+    changed = reloaded
+    for table in RAW_TABLES:
+        changed |= convert_integer_columns(conn, table)
+    
+    # Reservation month as a plain column, so monthly joins need no strftime() per row
+    if 'month' not in {name for _, name, *_ in conn.execute('PRAGMA table_info(reservations)')}:
+        with conn:
+            conn.execute('ALTER TABLE reservations ADD COLUMN month INTEGER')
+            conn.execute("UPDATE reservations SET month = CAST(strftime('%m', created_at) AS INTEGER)")
+        changed = True
+    
+    tables = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    for name, sql in DERIVED_TABLES.items():
+        if changed or name not in tables:
+            with conn:
+                conn.execute(f'DROP TABLE IF EXISTS {name}')
+                conn.execute(sql)
+            changed = True
+    
+    existing = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    missing = [sql for name, sql in INDEXES.items() if name not in existing]
+    for sql in missing:
+        conn.execute(sql)
+    
+    # Refresh planner statistics only when something was built
+    if changed or missing:
+        conn.execute('ANALYZE')
+        conn.commit()
+
+def flag_to_bool(series):
+    """Return a flag column as booleans (NaN where the flag is missing)"""
+    return series.map(FLAG_BOOLS)
+
+def read_sql_cached(query, path=DB_PATH):
+    """Run a read query, reusing a Parquet copy of its result while the database is unchanged"""
+    # Imported here so the schema helpers work without pandas (simple_sql)
+    import pandas as pd
+    
+    key = hashlib.sha1(f'{path}\n{query}'.encode('utf-8')).hexdigest()
+    cache_path = os.path.join(CACHE_DIR, key + '.parquet')
+    
+    # Committed WAL-mode writes land in the -wal file until a checkpoint
+    db_mtime = max(os.path.getmtime(p) for p in (path, path + '-wal') if os.path.exists(p))
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= db_mtime:
+        try:
+            return pd.read_parquet(cache_path)
+        except ImportError:
+            pass
+    
+    df = pd.read_sql_query(query, get_conn(path))
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        df.to_parquet(cache_path, compression='zstd', index=False)
+    except (ImportError, ValueError, TypeError):
+        # No Parquet engine, or a column Parquet cannot type; skip the cache
+        pass
+    
+    return df
@@ -5,13 +5,13 @@ conn = sqlite3.connect('marketplace_analysis.db')
 
 # Check the data structure
 print("=== SEARCH EVENTS ===")
-search_events = pd.read_sql_query("SELECT * FROM search_events WHERE is_bot = 'False' LIMIT 5", conn)
+search_events = pd.read_sql_query("SELECT * FROM search_events WHERE is_bot IN (0, 'False') LIMIT 5", conn)
 print("Search events columns:", list(search_events.columns))
 print("Search events sample:")
 print(search_events[['merged_amplitude_id', 'search_sort', 'event_time']].head())
 
 print("\n=== LISTING VIEWS ===")
-click_events = pd.read_sql_query("SELECT * FROM listing_views WHERE is_bot = 'False' LIMIT 5", conn)
+click_events = pd.read_sql_query("SELECT * FROM listing_views WHERE is_bot IN (0, 'False') LIMIT 5", conn)
 print("Click events columns:", list(click_events.columns))
 print("Click events sample:")
 print(click_events[['merged_amplitude_id', 'search_position', 'event_time']].head())
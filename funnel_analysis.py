@@ -1,74 +1,50 @@
-import sqlite3
-import csv
+import matplotlib
+matplotlib.use('Agg')  # charts are only written to PNG; no GUI backend
 import matplotlib.pyplot as plt
 import pandas as pd
+from db import ensure_schema, get_conn, load_csv_table
 
 # Create database if needed
-conn = sqlite3.connect('marketplace_analysis.db')
+conn = get_conn()
 
 # Always reload data to ensure we have all tables
 print('Loading data into database...')
 
-# Load search events
-with open('all_search_events (1).csv', 'r', encoding='utf-8') as f:
-    reader = csv.reader(f)
-    headers = next(reader)
-    conn.execute('DROP TABLE IF EXISTS search_events')
-    conn.execute('CREATE TABLE search_events (' + ','.join([f'{h} TEXT' for h in headers]) + ')')
-    for row in reader:
-        conn.execute('INSERT INTO search_events VALUES (' + ','.join(['?' for _ in headers]) + ')', row)
-
-# Load listing views
-with open('view_listing_detail_events (1).csv', 'r', encoding='utf-8') as f:
-    reader = csv.reader(f)
-    headers = next(reader)
-    conn.execute('DROP TABLE IF EXISTS listing_views')
-    conn.execute('CREATE TABLE listing_views (' + ','.join([f'{h} TEXT' for h in headers]) + ')')
-    for row in reader:
-        conn.execute('INSERT INTO listing_views VALUES (' + ','.join(['?' for _ in headers]) + ')', row)
-
-# Load reservations
-with open('reservations (1).csv', 'r', encoding='utf-8') as f:
-    reader = csv.reader(f)
-    headers = next(reader)
-    conn.execute('DROP TABLE IF EXISTS reservations')
-    conn.execute('CREATE TABLE reservations (' + ','.join([f'{h} TEXT' for h in headers]) + ')')
-    for row in reader:
-        conn.execute('INSERT INTO reservations VALUES (' + ','.join(['?' for _ in headers]) + ')', row)
-
-# Load user IDs
-with open('amplitude_user_ids (1).csv', 'r', encoding='utf-8') as f:
-    reader = csv.reader(f)
-    headers = next(reader)
-    conn.execute('DROP TABLE IF EXISTS amplitude_user_ids')
-    conn.execute('CREATE TABLE amplitude_user_ids (' + ','.join([f'{h} TEXT' for h in headers]) + ')')
-    for row in reader:
-        conn.execute('INSERT INTO amplitude_user_ids VALUES (' + ','.join(['?' for _ in headers]) + ')', row)
-
-conn.commit()
+# Bulk-load setting: no per-commit fsync (WAL, mmap and temp space come from get_conn)
+conn.execute('PRAGMA synchronous=OFF')
+
+tables = [
+    ('all_search_events (1).csv', 'search_events'),
+    ('view_listing_detail_events (1).csv', 'listing_views'),
+    ('reservations (1).csv', 'reservations'),
+    ('amplitude_user_ids (1).csv', 'amplitude_user_ids'),
+]
+
+for csv_path, table in tables:
+    load_csv_table(conn, csv_path, table)
+
+# Shared derived tables and indexes (bot filter and user join keys for the funnel query)
+ensure_schema(conn, reloaded=True)
+
 print('Data loaded successfully!')
 
 # Get funnel metrics
 print('\n=== CALCULATING FUNNEL METRICS ===')
+# One pass over the distinct non-bot searchers, each checked against the
+# later stages by indexed membership lookups rather than a fanned-out join
 query = '''
-WITH cleaned_search_events AS (
-    SELECT * FROM search_events WHERE is_bot = 'False'
-),
-cleaned_listing_views AS (
-    SELECT * FROM listing_views WHERE is_bot = 'False'
-),
-cleaned_reservations AS (
-    SELECT * FROM reservations WHERE renter_user_id IS NOT NULL
+WITH searchers AS (
+    SELECT DISTINCT merged_amplitude_id AS user_id
+    FROM search_events
+    WHERE is_bot = 0 AND merged_amplitude_id IS NOT NULL
 )
 SELECT 
-    COUNT(DISTINCT s.merged_amplitude_id) AS total_searchers,
-    COUNT(DISTINCT l.merged_amplitude_id) AS total_viewers,
-    COUNT(DISTINCT r.renter_user_id) AS total_reservers,
-    COUNT(DISTINCT CASE WHEN r.successful_payment_collected_at IS NOT NULL 
-                       THEN r.renter_user_id END) AS total_payers
-FROM cleaned_search_events s
-LEFT JOIN cleaned_listing_views l ON s.merged_amplitude_id = l.merged_amplitude_id
-LEFT JOIN cleaned_reservations r ON s.merged_amplitude_id = r.renter_user_id
+    COUNT(*) AS total_searchers,
+    COALESCE(SUM(user_id IN (SELECT merged_amplitude_id FROM listing_views WHERE is_bot = 0)), 0) AS total_viewers,
+    COALESCE(SUM(user_id IN (SELECT renter_user_id FROM reservations)), 0) AS total_reservers,
+    COALESCE(SUM(user_id IN (SELECT renter_user_id FROM reservations
+                             WHERE successful_payment_collected_at IS NOT NULL)), 0) AS total_payers
+FROM searchers
 '''
 
 result = conn.execute(query).fetchone()
@@ -124,13 +100,11 @@ for i, rate in enumerate(conversion_rates):
     ax2.text(i, rate + 1, f'{rate:.1f}%', ha='center', fontweight='bold', fontsize=11)
 
 plt.tight_layout()
-plt.savefig('funnel_metrics.png', dpi=300, bbox_inches='tight')
-plt.show()
+fig.savefig('funnel_metrics.png', dpi=300, bbox_inches='tight')
+plt.close(fig)
 
 print(f'\n=== KEY INSIGHTS ===')
 print(f'- {searchers - viewers:,} users ({100-search_to_view:.1f}%) dropped off after searching')
 print(f'- {viewers - reservers:,} users ({100-view_to_reserve:.1f}%) dropped off after viewing')
 print(f'- {reservers - payers:,} users ({100-reserve_to_pay:.1f}%) dropped off after reserving')
 print(f'- Only {overall:.2f}% of searchers complete the full journey to payment')
-
-conn.close()
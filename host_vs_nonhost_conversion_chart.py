@@ -1,68 +1,65 @@
 import pandas as pd
+import matplotlib
+matplotlib.use('Agg')  # charts are only written to PNG; no GUI backend
 import matplotlib.pyplot as plt
-import sqlite3
 import numpy as np
+from db import ensure_schema, flag_to_bool, get_conn
 
 def create_host_vs_nonhost_conversion_chart():
     """
     Create a chart showing conversion rates for hosts vs non-hosts.
     """
     
-    # Connect to database
-    conn = sqlite3.connect('marketplace_analysis.db')
+    # Shared memory-mapped connection
+    conn = get_conn()
+    ensure_schema(conn)
     
     print("Loading data for host vs non-host conversion analysis...")
     
-    # Load data
-    search_events = pd.read_sql_query("SELECT * FROM search_events WHERE is_bot = 'False'", conn)
-    click_events = pd.read_sql_query("SELECT * FROM listing_views WHERE is_bot = 'False'", conn)
-    reservations = pd.read_sql_query("SELECT * FROM reservations", conn)
-    
-    # Convert timestamps
-    search_events['event_time'] = pd.to_datetime(search_events['event_time'])
-    click_events['event_time'] = pd.to_datetime(click_events['event_time'])
-    reservations['created_at'] = pd.to_datetime(reservations['created_at'])
-    
-    # Get users who completed the full funnel
-    searchers = set(search_events['merged_amplitude_id'].unique())
-    clickers = set(click_events['merged_amplitude_id'].unique())
-    reservers = set(reservations['renter_user_id'].unique())
-    funnel_users = searchers.intersection(clickers).intersection(reservers)
+    # Load only the user IDs (and host flag) this analysis uses, one row per
+    # distinct value, in a single round-trip with each row tagged by its stage
+    users_df = pd.read_sql_query("""
+        SELECT DISTINCT 'S' AS stage, merged_amplitude_id AS user_id, is_host
+        FROM search_events WHERE is_bot = 0
+        UNION ALL
+        SELECT DISTINCT 'C', merged_amplitude_id, NULL FROM listing_views WHERE is_bot = 0
+        UNION ALL
+        SELECT DISTINCT 'R', renter_user_id, NULL FROM reservations
+    """, conn)
+    search_events = users_df[users_df['stage'] == 'S']
+    stage_ids = {stage: np.unique(ids.dropna().to_numpy())
+                 for stage, ids in users_df.groupby('stage', sort=False)['user_id']}
+    
+    # Get users who completed the full funnel, as sorted unique ID arrays so
+    # every intersection is a sorted merge rather than Python set hashing
+    # (a stage with no rows has no group, so it gets an empty array)
+    empty_ids = users_df['user_id'].to_numpy()[:0]
+    searchers, clickers, reservers = (stage_ids.get(stage, empty_ids) for stage in ('S', 'C', 'R'))
+    funnel_users = np.intersect1d(np.intersect1d(searchers, clickers, assume_unique=True),
+                                  reservers, assume_unique=True)
     
     # Analyze by host status
     host_data = []
     
-    # Non-hosts (is_host = 'False')
-    non_host_searches = search_events[search_events['is_host'] == 'False']
-    non_host_users = set(non_host_searches['merged_amplitude_id'].unique())
-    non_host_funnel_users = len(non_host_users.intersection(funnel_users))
-    non_host_conversion_rate = (non_host_funnel_users / len(non_host_users) * 100) if len(non_host_users) > 0 else 0
-    
-    host_data.append({
-        'user_type': 'Non-Hosts',
-        'total_searchers': len(non_host_users),
-        'funnel_users': non_host_funnel_users,
-        'conversion_rate': non_host_conversion_rate
-    })
-    
-    # Hosts (is_host = 'True')
-    host_searches = search_events[search_events['is_host'] == 'True']
-    host_users = set(host_searches['merged_amplitude_id'].unique())
-    host_funnel_users = len(host_users.intersection(funnel_users))
-    host_conversion_rate = (host_funnel_users / len(host_users) * 100) if len(host_users) > 0 else 0
-    
-    host_data.append({
-        'user_type': 'Hosts',
-        'total_searchers': len(host_users),
-        'funnel_users': host_funnel_users,
-        'conversion_rate': host_conversion_rate
-    })
+    # is_host reads as 0/1 or 'True'/'False' depending on which script built the database
+    host_flags = flag_to_bool(search_events['is_host'])
+    for user_type, is_host in [('Non-Hosts', False), ('Hosts', True)]:
+        users = np.unique(search_events.loc[host_flags == is_host, 'user_id'].dropna().to_numpy())
+        type_funnel_users = len(np.intersect1d(users, funnel_users, assume_unique=True))
+        conversion_rate = (type_funnel_users / len(users) * 100) if len(users) > 0 else 0
+        
+        host_data.append({
+            'user_type': user_type,
+            'total_searchers': len(users),
+            'funnel_users': type_funnel_users,
+            'conversion_rate': conversion_rate
+        })
     
     # Create DataFrame
     host_df = pd.DataFrame(host_data)
     
     # Create the chart
-    plt.figure(figsize=(12, 8))
+    fig = plt.figure(figsize=(12, 8))
     
     # Create horizontal bar chart
     colors = ['#2E86AB', '#A23B72']
@@ -92,11 +89,11 @@ def create_host_vs_nonhost_conversion_chart():
     plt.tight_layout()
     
     # Save the chart
-    plt.savefig('host_vs_nonhost_conversion_chart.png', dpi=300, bbox_inches='tight')
+    fig.savefig('host_vs_nonhost_conversion_chart.png', dpi=300, bbox_inches='tight')
     print("Chart saved as 'host_vs_nonhost_conversion_chart.png'")
     
-    # Show the chart
-    plt.show()
+    # Release the figure
+    plt.close(fig)
     
     # Print summary table
     print("\n" + "="*60)
@@ -137,11 +134,9 @@ def create_host_vs_nonhost_conversion_chart():
     total_searchers = host_df['total_searchers'].sum()
     print(f"MARKET SHARE:")
     for _, row in host_df.iterrows():
-        market_share = (row['total_searchers'] / total_searchers) * 100
+        market_share = (row['total_searchers'] / total_searchers) * 100 if total_searchers > 0 else 0
         print(f"  - {row['user_type']}: {market_share:.1f}% of total searchers")
     
-    conn.close()
-    
     return host_df
 
 if __name__ == "__main__":
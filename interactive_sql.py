@@ -11,37 +11,31 @@ import sqlite3
 import pandas as pd
 import sys
 import os
+from csv_cache import iter_cached
+from db import ensure_schema, get_conn
 
 def create_database():
     """Create the database if it doesn't exist"""
     if not os.path.exists('marketplace_analysis.db'):
         print("Creating database from CSV files...")
         
-        # Load CSV files
-        search_events = pd.read_csv('all_search_events (1).csv')
-        listing_views = pd.read_csv('view_listing_detail_events (1).csv')
-        reservations = pd.read_csv('reservations (1).csv')
-        user_ids = pd.read_csv('amplitude_user_ids (1).csv')
-        
-        # Convert date columns
-        search_events['event_time'] = pd.to_datetime(search_events['event_time'])
-        search_events['event_date'] = pd.to_datetime(search_events['event_date'])
-        
-        listing_views['event_time'] = pd.to_datetime(listing_views['event_time'])
-        listing_views['event_date'] = pd.to_datetime(listing_views['event_date'])
-        
-        reservations['created_at'] = pd.to_datetime(reservations['created_at'])
-        reservations['approved_at'] = pd.to_datetime(reservations['approved_at'])
-        reservations['successful_payment_collected_at'] = pd.to_datetime(reservations['successful_payment_collected_at'])
-        
         # Create database
         conn = sqlite3.connect('marketplace_analysis.db')
         
-        # Write data to database
-        search_events.to_sql('search_events', conn, if_exists='replace', index=False)
-        listing_views.to_sql('listing_views', conn, if_exists='replace', index=False)
-        reservations.to_sql('reservations', conn, if_exists='replace', index=False)
-        user_ids.to_sql('amplitude_user_ids', conn, if_exists='replace', index=False)
+        # Copy each export through the Parquet cache in row chunks, so peak
+        # memory is bounded by one chunk rather than the whole table
+        tables = [
+            ('all_search_events (1).csv', 'search_events'),
+            ('view_listing_detail_events (1).csv', 'listing_views'),
+            ('reservations (1).csv', 'reservations'),
+            ('amplitude_user_ids (1).csv', 'amplitude_user_ids'),
+        ]
+        for csv_path, table in tables:
+            for i, chunk in enumerate(iter_cached(csv_path)):
+                chunk.to_sql(table, conn, if_exists='replace' if i == 0 else 'append', index=False)
+        
+        # Shared key column types, derived tables and indexes
+        ensure_schema(conn, reloaded=True)
         
         conn.close()
         print("Database created successfully!")
@@ -91,8 +85,9 @@ def interactive_sql():
     # Create database if needed
     create_database()
     
-    # Connect to database
-    conn = sqlite3.connect('marketplace_analysis.db')
+    # Shared WAL-mode connection: queries here keep reading while another
+    # script rebuilds or writes to the database
+    conn = get_conn()
     
     # Show available tables
     show_tables(conn)
@@ -155,9 +150,6 @@ def interactive_sql():
             break
         except Exception as e:
             print(f"❌ Unexpected error: {str(e)}")
-    
-    # Close connection
-    conn.close()
 
 if __name__ == "__main__":
     interactive_sql()
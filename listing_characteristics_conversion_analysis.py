@@ -1,74 +1,102 @@
+import os
 import pandas as pd
+import matplotlib
+matplotlib.use('Agg')  # charts are only written to PNG; no GUI backend
 import matplotlib.pyplot as plt
-import sqlite3
 import numpy as np
 import seaborn as sns
+from db import ensure_schema, flag_to_bool, get_conn, read_sql_cached
 
 def analyze_listing_characteristics_conversion():
     """
     Analyze which listing characteristics lead to higher conversion rates.
     """
     
-    # Connect to database
-    conn = sqlite3.connect('marketplace_analysis.db')
+    # Shared connection; bring the file to the shared schema (integer flags,
+    # join-key indexes) before the cached reads, so they do not invalidate the
+    # cache straight away
+    conn = get_conn()
+    ensure_schema(conn)
     
     print("Loading data for listing characteristics conversion analysis...")
     
-    # Load data
-    search_events = pd.read_sql_query("SELECT * FROM search_events WHERE is_bot = 'False'", conn)
-    click_events = pd.read_sql_query("SELECT * FROM listing_views WHERE is_bot = 'False'", conn)
-    reservations = pd.read_sql_query("SELECT * FROM reservations", conn)
+    # Load only the columns the analyses below use (Parquet-cached between runs)
+    search_events = read_sql_cached("""
+        SELECT merged_amplitude_id, event_time, search_sort, search_term_category, is_usa_canada, is_host
+        FROM search_events WHERE is_bot = 0
+    """)
+    click_events = read_sql_cached(
+        "SELECT merged_amplitude_id, search_position FROM listing_views WHERE is_bot = 0")
+    
+    # Downcast user IDs to the narrowest integer type that holds them
+    for df in (search_events, click_events):
+        df['merged_amplitude_id'] = pd.to_numeric(df['merged_amplitude_id'], downcast='integer')
+    
+    # Flags as booleans, however the database stores them; low-cardinality
+    # string columns as categoricals, so groupbys work on integer codes
+    for col in ['is_usa_canada', 'is_host']:
+        search_events[col] = flag_to_bool(search_events[col])
+    for col in ['search_sort', 'search_term_category']:
+        search_events[col] = search_events[col].astype('category')
+    click_events['search_position'] = click_events['search_position'].astype('category')
     
     # Convert timestamps
-    search_events['event_time'] = pd.to_datetime(search_events['event_time'])
-    click_events['event_time'] = pd.to_datetime(click_events['event_time'])
-    reservations['created_at'] = pd.to_datetime(reservations['created_at'])
-    
-    # Get users who completed the full funnel
-    searchers = set(search_events['merged_amplitude_id'].unique())
-    clickers = set(click_events['merged_amplitude_id'].unique())
-    reservers = set(reservations['renter_user_id'].unique())
-    funnel_users = searchers.intersection(clickers).intersection(reservers)
+    search_events['event_time'] = pd.to_datetime(search_events['event_time'], format='ISO8601')
+    
+    # Get users who completed the full funnel, intersected in SQL so no table
+    # is loaded just to derive IDs
+    funnel_users = frozenset(row[0] for row in conn.execute("""
+        SELECT merged_amplitude_id FROM search_events WHERE is_bot = 0
+        INTERSECT
+        SELECT merged_amplitude_id FROM listing_views WHERE is_bot = 0
+        INTERSECT
+        SELECT renter_user_id FROM reservations
+    """))
     
     print(f"Total funnel users: {len(funnel_users):,}")
     
+    # Filter each frame down to the funnel cohort once; analyzers count
+    # converting users on these smaller frames and totals on the full ones
+    search_funnel = search_events[search_events['merged_amplitude_id'].isin(funnel_users)]
+    click_funnel = click_events[click_events['merged_amplitude_id'].isin(funnel_users)]
+    
     # Analyze by different listing characteristics
     analyses = {}
     
     # 1. Search Position Analysis
     print("\n1. SEARCH POSITION ANALYSIS")
     print("="*50)
-    position_analysis = analyze_by_search_position(click_events, funnel_users)
+    position_analysis = analyze_by_search_position(click_events, click_funnel)
     analyses['search_position'] = position_analysis
     
     # 2. Search Sort Analysis
     print("\n2. SEARCH SORT ANALYSIS")
     print("="*50)
-    sort_analysis = analyze_by_search_sort(search_events, funnel_users)
+    sort_analysis = analyze_by_search_sort(search_events, search_funnel)
     analyses['search_sort'] = sort_analysis
     
     # 3. Search Term Category Analysis
     print("\n3. SEARCH TERM CATEGORY ANALYSIS")
     print("="*50)
-    category_analysis = analyze_by_search_term_category(search_events, funnel_users)
+    category_analysis = analyze_by_search_term_category(search_events, search_funnel)
     analyses['search_term_category'] = category_analysis
     
     # 4. Geographic Analysis
     print("\n4. GEOGRAPHIC ANALYSIS")
     print("="*50)
-    geo_analysis = analyze_by_geography(search_events, funnel_users)
+    geo_analysis = analyze_by_geography(search_events, search_funnel)
     analyses['geography'] = geo_analysis
     
     # 5. User Type Analysis
     print("\n5. USER TYPE ANALYSIS")
     print("="*50)
-    user_type_analysis = analyze_by_user_type(search_events, funnel_users)
+    user_type_analysis = analyze_by_user_type(search_events, search_funnel)
     analyses['user_type'] = user_type_analysis
     
     # 6. Time-based Analysis
     print("\n6. TIME-BASED ANALYSIS")
     print("="*50)
-    time_analysis = analyze_by_time(search_events, funnel_users)
+    time_analysis = analyze_by_time(search_events, search_funnel)
     analyses['time'] = time_analysis
     
     # Create summary visualization
@@ -77,204 +105,89 @@ def analyze_listing_characteristics_conversion():
     # Generate insights
     generate_insights(analyses)
     
-    conn.close()
+    # Keep the result tables for dashboards and notebooks to reuse
+    try:
+        os.makedirs('analysis_results', exist_ok=True)
+        for name, df in analyses.items():
+            df.to_parquet(f'analysis_results/listing_characteristics_{name}.parquet', index=False)
+    except ImportError:
+        # No Parquet engine installed; the tables are still returned
+        pass
     
     return analyses
 
-def analyze_by_search_position(click_events, funnel_users):
+def conversion_by(events, funnel_events, key, labels=None):
+    """
+    Count distinct users in events and converting users in funnel_events
+    (the funnel-cohort rows of events) per value of key.
+    
+    labels maps key values to characteristic names and fixes the row order
+    (values with no users get zero rows); otherwise rows follow first appearance.
+    """
+    total = events.groupby(key, sort=False)['merged_amplitude_id'].nunique()
+    converting = funnel_events.groupby(key, sort=False)['merged_amplitude_id'].nunique()
+    
+    if labels is not None:
+        total = total.reindex(list(labels), fill_value=0)
+    converting = converting.reindex(total.index, fill_value=0)
+    
+    df = pd.DataFrame({
+        'characteristic': total.index.map(labels) if labels is not None else total.index,
+        'total_users': total.to_numpy(),
+        'converting_users': converting.to_numpy(),
+    })
+    df['conversion_rate'] = (df['converting_users'] / df['total_users'] * 100).where(df['total_users'] > 0, 0)
+    return df
+
+def analyze_by_search_position(click_events, click_funnel):
     """Analyze conversion by search position"""
-    position_data = []
-    
-    for position in range(1, 11):  # Top 10 positions
-        position_clicks = click_events[click_events['search_position'] == str(position)]
-        position_users = set(position_clicks['merged_amplitude_id'].unique())
-        
-        total_users = len(position_users)
-        converting_users = len(position_users.intersection(funnel_users))
-        conversion_rate = (converting_users / total_users * 100) if total_users > 0 else 0
-        
-        position_data.append({
-            'characteristic': f'Position {position}',
-            'total_users': total_users,
-            'converting_users': converting_users,
-            'conversion_rate': conversion_rate
-        })
-    
-    df = pd.DataFrame(position_data)
+    # Top 10 positions
+    df = conversion_by(click_events, click_funnel, 'search_position',
+                       {str(position): f'Position {position}' for position in range(1, 11)})
     print("Search Position Conversion Rates:")
     print(df.to_string(index=False))
     return df
 
-def analyze_by_search_sort(search_events, funnel_users):
+def analyze_by_search_sort(search_events, search_funnel):
     """Analyze conversion by search sort preference"""
-    sort_data = []
-    
-    for sort_type in search_events['search_sort'].unique():
-        if pd.isna(sort_type):
-            continue
-            
-        sort_searches = search_events[search_events['search_sort'] == sort_type]
-        sort_users = set(sort_searches['merged_amplitude_id'].unique())
-        
-        total_users = len(sort_users)
-        converting_users = len(sort_users.intersection(funnel_users))
-        conversion_rate = (converting_users / total_users * 100) if total_users > 0 else 0
-        
-        sort_data.append({
-            'characteristic': sort_type,
-            'total_users': total_users,
-            'converting_users': converting_users,
-            'conversion_rate': conversion_rate
-        })
-    
-    df = pd.DataFrame(sort_data).sort_values('conversion_rate', ascending=False)
+    df = conversion_by(search_events, search_funnel, 'search_sort').sort_values('conversion_rate', ascending=False)
     print("Search Sort Conversion Rates:")
     print(df.to_string(index=False))
     return df
 
-def analyze_by_search_term_category(search_events, funnel_users):
+def analyze_by_search_term_category(search_events, search_funnel):
     """Analyze conversion by search term category"""
-    category_data = []
-    
-    for category in search_events['search_term_category'].unique():
-        if pd.isna(category):
-            continue
-            
-        category_searches = search_events[search_events['search_term_category'] == category]
-        category_users = set(category_searches['merged_amplitude_id'].unique())
-        
-        total_users = len(category_users)
-        converting_users = len(category_users.intersection(funnel_users))
-        conversion_rate = (converting_users / total_users * 100) if total_users > 0 else 0
-        
-        category_data.append({
-            'characteristic': category,
-            'total_users': total_users,
-            'converting_users': converting_users,
-            'conversion_rate': conversion_rate
-        })
-    
-    df = pd.DataFrame(category_data).sort_values('conversion_rate', ascending=False)
+    df = conversion_by(search_events, search_funnel, 'search_term_category').sort_values('conversion_rate', ascending=False)
     print("Search Term Category Conversion Rates:")
     print(df.to_string(index=False))
     return df
 
-def analyze_by_geography(search_events, funnel_users):
+def analyze_by_geography(search_events, search_funnel):
     """Analyze conversion by geographic characteristics"""
-    geo_data = []
-    
     # USA/Canada vs International
-    usa_canada_searches = search_events[search_events['is_usa_canada'] == 'True']
-    usa_canada_users = set(usa_canada_searches['merged_amplitude_id'].unique())
-    
-    total_users = len(usa_canada_users)
-    converting_users = len(usa_canada_users.intersection(funnel_users))
-    conversion_rate = (converting_users / total_users * 100) if total_users > 0 else 0
-    
-    geo_data.append({
-        'characteristic': 'USA/Canada',
-        'total_users': total_users,
-        'converting_users': converting_users,
-        'conversion_rate': conversion_rate
-    })
-    
-    # International
-    intl_searches = search_events[search_events['is_usa_canada'] == 'False']
-    intl_users = set(intl_searches['merged_amplitude_id'].unique())
-    
-    total_users = len(intl_users)
-    converting_users = len(intl_users.intersection(funnel_users))
-    conversion_rate = (converting_users / total_users * 100) if total_users > 0 else 0
-    
-    geo_data.append({
-        'characteristic': 'International',
-        'total_users': total_users,
-        'converting_users': converting_users,
-        'conversion_rate': conversion_rate
-    })
-    
-    df = pd.DataFrame(geo_data).sort_values('conversion_rate', ascending=False)
+    df = conversion_by(search_events, search_funnel, 'is_usa_canada',
+                       {True: 'USA/Canada', False: 'International'})
+    df = df.sort_values('conversion_rate', ascending=False)
     print("Geographic Conversion Rates:")
     print(df.to_string(index=False))
     return df
 
-def analyze_by_user_type(search_events, funnel_users):
+def analyze_by_user_type(search_events, search_funnel):
     """Analyze conversion by user type (host vs non-host)"""
-    user_type_data = []
-    
-    # Non-hosts
-    non_host_searches = search_events[search_events['is_host'] == 'False']
-    non_host_users = set(non_host_searches['merged_amplitude_id'].unique())
-    
-    total_users = len(non_host_users)
-    converting_users = len(non_host_users.intersection(funnel_users))
-    conversion_rate = (converting_users / total_users * 100) if total_users > 0 else 0
-    
-    user_type_data.append({
-        'characteristic': 'Non-Hosts',
-        'total_users': total_users,
-        'converting_users': converting_users,
-        'conversion_rate': conversion_rate
-    })
-    
-    # Hosts
-    host_searches = search_events[search_events['is_host'] == 'True']
-    host_users = set(host_searches['merged_amplitude_id'].unique())
-    
-    total_users = len(host_users)
-    converting_users = len(host_users.intersection(funnel_users))
-    conversion_rate = (converting_users / total_users * 100) if total_users > 0 else 0
-    
-    user_type_data.append({
-        'characteristic': 'Hosts',
-        'total_users': total_users,
-        'converting_users': converting_users,
-        'conversion_rate': conversion_rate
-    })
-    
-    df = pd.DataFrame(user_type_data).sort_values('conversion_rate', ascending=False)
+    df = conversion_by(search_events, search_funnel, 'is_host', {False: 'Non-Hosts', True: 'Hosts'})
+    df = df.sort_values('conversion_rate', ascending=False)
     print("User Type Conversion Rates:")
     print(df.to_string(index=False))
     return df
 
-def analyze_by_time(search_events, funnel_users):
+def analyze_by_time(search_events, search_funnel):
     """Analyze conversion by time characteristics"""
-    time_data = []
-    
-    # Extract hour of day
-    search_events['hour'] = search_events['event_time'].dt.hour
-    
     # Peak hours (9-17) vs Off-peak hours
-    peak_searches = search_events[(search_events['hour'] >= 9) & (search_events['hour'] <= 17)]
-    peak_users = set(peak_searches['merged_amplitude_id'].unique())
-    
-    total_users = len(peak_users)
-    converting_users = len(peak_users.intersection(funnel_users))
-    conversion_rate = (converting_users / total_users * 100) if total_users > 0 else 0
-    
-    time_data.append({
-        'characteristic': 'Peak Hours (9-17)',
-        'total_users': total_users,
-        'converting_users': converting_users,
-        'conversion_rate': conversion_rate
-    })
-    
-    # Off-peak hours
-    off_peak_searches = search_events[(search_events['hour'] < 9) | (search_events['hour'] > 17)]
-    off_peak_users = set(off_peak_searches['merged_amplitude_id'].unique())
-    
-    total_users = len(off_peak_users)
-    converting_users = len(off_peak_users.intersection(funnel_users))
-    conversion_rate = (converting_users / total_users * 100) if total_users > 0 else 0
-    
-    time_data.append({
-        'characteristic': 'Off-Peak Hours',
-        'total_users': total_users,
-        'converting_users': converting_users,
-        'conversion_rate': conversion_rate
-    })
-    
-    df = pd.DataFrame(time_data).sort_values('conversion_rate', ascending=False)
+    hour = search_events['event_time'].dt.hour
+    is_peak = hour.between(9, 17).where(hour.notna())
+    df = conversion_by(search_events.assign(is_peak=is_peak), search_funnel.assign(is_peak=is_peak), 'is_peak',
+                       {True: 'Peak Hours (9-17)', False: 'Off-Peak Hours'})
+    df = df.sort_values('conversion_rate', ascending=False)
     print("Time-based Conversion Rates:")
     print(df.to_string(index=False))
     return df
@@ -304,9 +217,9 @@ def create_summary_chart(analyses):
                        f'{rate:.1f}%', ha='center', va='bottom', fontweight='bold', fontsize=8)
     
     plt.tight_layout()
-    plt.savefig('listing_characteristics_conversion_summary.png', dpi=300, bbox_inches='tight')
+    fig.savefig('listing_characteristics_conversion_summary.png', dpi=300, bbox_inches='tight')
     print("\nSummary chart saved as 'listing_characteristics_conversion_summary.png'")
-    plt.show()
+    plt.close(fig)
 
 def generate_insights(analyses):
     """Generate key insights from all analyses"""
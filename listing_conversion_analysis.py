@@ -1,110 +1,108 @@
+import os
 import pandas as pd
 import numpy as np
-import sqlite3
+from db import read_sql_cached
 
 def analyze_listing_conversion_characteristics():
     """
     Analyze which listing characteristics lead to better conversion rates.
     """
     
-    # Connect to database
-    conn = sqlite3.connect('marketplace_analysis.db')
-    
     print("Loading data from database...")
     
-    # Load data
-    listing_views = pd.read_sql_query("SELECT * FROM listing_views", conn)
-    reservations = pd.read_sql_query("SELECT * FROM reservations", conn)
+    # Load only the columns the analyses below use (Parquet-cached between runs);
+    # positions and listing IDs are cast to integers in SQL for the numeric bins
+    listing_views = read_sql_cached("""
+        SELECT listing_id, CAST(listing_id AS INTEGER) AS listing_id_num, event_time,
+               CAST(search_position AS INTEGER) AS search_position, source_screen, click_dma,
+               first_attribution_source, first_attribution_channel, is_bot, is_host,
+               month, hex_1_resolution, is_listing_reserved
+        FROM listing_views
+    """)
+    reservations = read_sql_cached("SELECT listing_id FROM reservations")
     
     print(f"Loaded {len(listing_views)} listing views")
     print(f"Loaded {len(reservations)} reservations")
     
-    # Convert timestamps
-    listing_views['event_time'] = pd.to_datetime(listing_views['event_time'])
-    reservations['created_at'] = pd.to_datetime(reservations['created_at'])
+    # Downcast the integer columns to the narrowest type that holds them
+    int_cols = ['listing_id_num', 'search_position']
+    listing_views[int_cols] = listing_views[int_cols].apply(pd.to_numeric, downcast='integer')
+    
+    # Low-cardinality columns as categoricals, so the per-category equality
+    # scans compare integer codes instead of strings (the flags are only
+    # grouped on, and read as 0/1 or 'True'/'False' depending on the build)
+    for col in ['source_screen', 'click_dma', 'first_attribution_source', 'first_attribution_channel',
+                'is_bot', 'is_host', 'month', 'hex_1_resolution', 'is_listing_reserved']:
+        listing_views[col] = listing_views[col].astype('category')
+    
+    # Convert timestamps (ISO text, with fractional seconds in some builds)
+    listing_views['event_time'] = pd.to_datetime(listing_views['event_time'], format='ISO8601')
+    
+    # Derive every binned/time column once, before any analysis scans the frame
+    listing_views['position_bin'] = pd.cut(listing_views['search_position'], 
+                                          bins=[0, 5, 10, 15, 20, 100], 
+                                          labels=['1-5', '6-10', '11-15', '16-20', '20+'])
+    listing_views['day_of_week'] = listing_views['event_time'].dt.day_name()
+    listing_views['hour_bin'] = pd.cut(listing_views['event_time'].dt.hour, 
+                                      bins=[0, 6, 12, 18, 24], 
+                                      labels=['Night (0-6)', 'Morning (6-12)', 'Afternoon (12-18)', 'Evening (18-24)'])
+    listing_views['listing_id_bin'] = pd.cut(listing_views['listing_id_num'], 
+                                           bins=[0, 100, 500, 1000, 2000, 10000], 
+                                           labels=['1-100', '101-500', '501-1000', '1001-2000', '2000+'])
     
     # Get listings that were reserved
-    reserved_listings = set(reservations['listing_id'].unique())
+    reserved_listings = reservations['listing_id'].unique()
     print(f"Total unique listings that were reserved: {len(reserved_listings):,}")
     
     # Get all listings that were viewed
-    all_viewed_listings = set(listing_views['listing_id'].unique())
+    all_viewed_listings = listing_views['listing_id'].unique()
     print(f"Total unique listings that were viewed: {len(all_viewed_listings):,}")
     
-    # Calculate conversion rate by listing
-    listing_conversion_stats = []
+    # Reservation count per listing, looked up by the per-listing stats and by
+    # every category below instead of rescanning the reservations table
+    reservations_per_listing = reservations.groupby('listing_id').size()
     
-    for listing_id in all_viewed_listings:
-        # Get views for this listing
-        listing_views_data = listing_views[listing_views['listing_id'] == listing_id]
-        total_views = len(listing_views_data)
-        
-        # Check if this listing was ever reserved
-        was_reserved = listing_id in reserved_listings
-        
-        # Get reservations for this listing
-        listing_reservations = reservations[reservations['listing_id'] == listing_id]
-        total_reservations = len(listing_reservations)
+    # Calculate conversion rate by listing, with view counts aligned on listing_id
+    listing_stats_df = listing_views.groupby('listing_id').size().rename('total_views').to_frame()
+    listing_stats_df['total_reservations'] = reservations_per_listing.reindex(listing_stats_df.index, fill_value=0)
+    listing_stats_df['was_reserved'] = listing_stats_df['total_reservations'] > 0
+    listing_stats_df['conversion_rate'] = listing_stats_df['total_reservations'] / listing_stats_df['total_views'] * 100
+    listing_stats_df = listing_stats_df.reset_index()
+    
+    # Create a function to analyze conversion by listing characteristic: one
+    # groupby over the views and one over the distinct (category, listing) pairs
+    def analyze_listing_characteristic_by_category(df, category_col, min_views=10):
+        views = df[[category_col, 'listing_id']]
+        total_views = views.groupby(category_col, sort=False, observed=True).size()
         
-        # Calculate conversion rate
-        conversion_rate = (total_reservations / total_views * 100) if total_views > 0 else 0
+        # Reservations per distinct listing, so each counts once per category
+        listings = views.dropna(subset=[category_col]).drop_duplicates()
+        listing_reservations = pd.DataFrame({
+            category_col: listings[category_col].to_numpy(),
+            'total_reservations': reservations_per_listing.reindex(listings['listing_id'], fill_value=0).to_numpy(),
+        })
+        listing_reservations['reserved'] = listing_reservations['total_reservations'] > 0
+        by_category = listing_reservations.groupby(category_col, sort=False, observed=True)
         
-        listing_conversion_stats.append({
-            'listing_id': listing_id,
+        results = pd.DataFrame({
             'total_views': total_views,
-            'total_reservations': total_reservations,
-            'was_reserved': was_reserved,
-            'conversion_rate': conversion_rate
+            'total_reservations': by_category['total_reservations'].sum(),
+            'unique_listings': by_category.size(),
+            'reserved_listings': by_category['reserved'].sum(),
         })
-    
-    listing_stats_df = pd.DataFrame(listing_conversion_stats)
-    
-    # Create a function to analyze conversion by listing characteristic
-    def analyze_listing_characteristic_by_category(df, category_col, min_views=10):
-        results = []
-        
-        for category in df[category_col].unique():
-            if pd.isna(category):
-                continue
-                
-            # Get listings for this category
-            category_listings = df[df[category_col] == category]
-            category_listing_ids = set(category_listings['listing_id'].unique())
-            
-            # Calculate metrics for this category
-            total_views = len(category_listings)
-            total_reservations = len(reservations[reservations['listing_id'].isin(category_listing_ids)])
-            conversion_rate = (total_reservations / total_views * 100) if total_views > 0 else 0
-            
-            # Get unique listings in this category
-            unique_listings = len(category_listing_ids)
-            reserved_listings_in_category = len(category_listing_ids.intersection(reserved_listings))
-            listing_reservation_rate = (reserved_listings_in_category / unique_listings * 100) if unique_listings > 0 else 0
-            
-            if total_views >= min_views:
-                results.append({
-                    'category': category,
-                    'total_views': total_views,
-                    'total_reservations': total_reservations,
-                    'conversion_rate': conversion_rate,
-                    'unique_listings': unique_listings,
-                    'reserved_listings': reserved_listings_in_category,
-                    'listing_reservation_rate': listing_reservation_rate
-                })
+        results = results[results['total_views'] >= min_views].rename_axis('category').reset_index()
+        results['conversion_rate'] = results['total_reservations'] / results['total_views'] * 100
+        results['listing_reservation_rate'] = results['reserved_listings'] / results['unique_listings'] * 100
         
-        return pd.DataFrame(results).sort_values('conversion_rate', ascending=False)
+        return results[['category', 'total_views', 'total_reservations', 'conversion_rate',
+                        'unique_listings', 'reserved_listings', 'listing_reservation_rate']
+                       ].sort_values('conversion_rate', ascending=False)
     
     # Analyze by different listing characteristics
     print("\n" + "="*80)
     print("LISTING CONVERSION BY SEARCH POSITION")
     print("="*80)
     
-    # Convert search_position to numeric for analysis
-    listing_views['search_position_numeric'] = pd.to_numeric(listing_views['search_position'], errors='coerce')
-    listing_views['position_bin'] = pd.cut(listing_views['search_position_numeric'], 
-                                          bins=[0, 5, 10, 15, 20, 100], 
-                                          labels=['1-5', '6-10', '11-15', '16-20', '20+'])
-    
     position_analysis = analyze_listing_characteristic_by_category(listing_views, 'position_bin', min_views=50)
     print(position_analysis.to_string(index=False))
     
@@ -156,17 +154,11 @@ def analyze_listing_conversion_characteristics():
     print(month_analysis.to_string(index=False))
     
     # Day of week analysis
-    listing_views['day_of_week'] = listing_views['event_time'].dt.day_name()
     dow_analysis = analyze_listing_characteristic_by_category(listing_views, 'day_of_week', min_views=50)
     print("\nConversion by Day of Week:")
     print(dow_analysis.to_string(index=False))
     
     # Hour analysis
-    listing_views['hour'] = listing_views['event_time'].dt.hour
-    listing_views['hour_bin'] = pd.cut(listing_views['hour'], 
-                                      bins=[0, 6, 12, 18, 24], 
-                                      labels=['Night (0-6)', 'Morning (6-12)', 'Afternoon (12-18)', 'Evening (18-24)'])
-    
     hour_analysis = analyze_listing_characteristic_by_category(listing_views, 'hour_bin', min_views=50)
     print("\nConversion by Time of Day:")
     print(hour_analysis.to_string(index=False))
@@ -177,26 +169,12 @@ def analyze_listing_conversion_characteristics():
     print("="*80)
     
     # Get listings with high view counts
-    listing_view_counts = listing_views.groupby('listing_id').size()
-    high_volume_listings = listing_view_counts[listing_view_counts >= 100].index
+    high_volume_df = listing_stats_df.loc[listing_stats_df['total_views'] >= 100,
+                                          ['listing_id', 'total_views', 'total_reservations', 'conversion_rate']]
     
-    print(f"Listings with 100+ views: {len(high_volume_listings)}")
+    print(f"Listings with 100+ views: {len(high_volume_df)}")
     
-    # Analyze conversion for high-volume listings
-    high_volume_analysis = []
-    for listing_id in high_volume_listings:
-        views = listing_view_counts[listing_id]
-        listing_reservations = len(reservations[reservations['listing_id'] == listing_id])
-        conversion_rate = (listing_reservations / views * 100) if views > 0 else 0
-        
-        high_volume_analysis.append({
-            'listing_id': listing_id,
-            'total_views': views,
-            'total_reservations': listing_reservations,
-            'conversion_rate': conversion_rate
-        })
-    
-    high_volume_df = pd.DataFrame(high_volume_analysis).sort_values('conversion_rate', ascending=False)
+    high_volume_df = high_volume_df.sort_values('conversion_rate', ascending=False)
     print("\nTop 10 high-volume listings by conversion rate:")
     print(high_volume_df.head(10).to_string(index=False))
     
@@ -225,12 +203,6 @@ def analyze_listing_conversion_characteristics():
     print("LISTING ID PATTERN ANALYSIS")
     print("="*80)
     
-    # Convert listing_id to numeric for analysis
-    listing_views['listing_id_numeric'] = pd.to_numeric(listing_views['listing_id'], errors='coerce')
-    listing_views['listing_id_bin'] = pd.cut(listing_views['listing_id_numeric'], 
-                                           bins=[0, 100, 500, 1000, 2000, 10000], 
-                                           labels=['1-100', '101-500', '501-1000', '1001-2000', '2000+'])
-    
     listing_id_analysis = analyze_listing_characteristic_by_category(listing_views, 'listing_id_bin', min_views=50)
     print("Conversion by Listing ID Range:")
     print(listing_id_analysis.to_string(index=False))
@@ -256,9 +228,7 @@ def analyze_listing_conversion_characteristics():
     print(f"\nTop 10 listings by conversion rate (10+ views):")
     print(top_listings.to_string(index=False))
     
-    conn.close()
-    
-    return {
+    results = {
         'position_analysis': position_analysis,
         'source_screen_analysis': source_screen_analysis,
         'dma_analysis': dma_analysis,
@@ -275,6 +245,16 @@ def analyze_listing_conversion_characteristics():
         'listing_id_analysis': listing_id_analysis,
         'listing_stats': listing_stats_df
     }
+    
+    # Persist the result tables for downstream reuse
+    try:
+        os.makedirs('analysis_results', exist_ok=True)
+        for name, df in results.items():
+            df.to_parquet(f'analysis_results/listing_conversion_{name}.parquet', index=False)
+    except ImportError:
+        pass
+    
+    return results
 
 if __name__ == "__main__":
     results = analyze_listing_conversion_characteristics()
@@ -2,7 +2,7 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import sqlite3
 import numpy as np
-from datetime import datetime
+from db import ensure_schema
 
 def create_monthly_conversion_chart():
     """
@@ -11,51 +11,33 @@ def create_monthly_conversion_chart():
     
     # Connect to database
     conn = sqlite3.connect('marketplace_analysis.db')
+    ensure_schema(conn)
     
     print("Loading data for monthly conversion analysis...")
     
-    # Load data
-    search_events = pd.read_sql_query("SELECT * FROM search_events WHERE is_bot = 'False'", conn)
-    click_events = pd.read_sql_query("SELECT * FROM listing_views WHERE is_bot = 'False'", conn)
-    reservations = pd.read_sql_query("SELECT * FROM reservations", conn)
-    
-    # Convert timestamps
-    search_events['event_time'] = pd.to_datetime(search_events['event_time'])
-    click_events['event_time'] = pd.to_datetime(click_events['event_time'])
-    reservations['created_at'] = pd.to_datetime(reservations['created_at'])
+    # Load only the user ids and search month; the bot filter runs in SQL
+    # (the click and reservation reads are covered by the join-key indexes)
+    search_events = pd.read_sql_query("SELECT merged_amplitude_id, month FROM search_events WHERE is_bot = 0", conn)
+    click_events = pd.read_sql_query("SELECT merged_amplitude_id FROM listing_views WHERE is_bot = 0", conn)
+    reservations = pd.read_sql_query("SELECT renter_user_id FROM reservations", conn)
     
     # Get users who completed the full funnel
-    searchers = set(search_events['merged_amplitude_id'].unique())
-    clickers = set(click_events['merged_amplitude_id'].unique())
-    reservers = set(reservations['renter_user_id'].unique())
-    funnel_users = searchers.intersection(clickers).intersection(reservers)
-    
-    # Analyze by month
-    months = search_events['month'].unique()
-    month_data = []
-    
-    for month in sorted(months):
-        if pd.isna(month):
-            continue
-            
-        # Get searches for this month
-        month_searches = search_events[search_events['month'] == month]
-        month_users = set(month_searches['merged_amplitude_id'].unique())
-        
-        # Calculate metrics
-        total_searchers = len(month_users)
-        funnel_users_in_month = len(month_users.intersection(funnel_users))
-        conversion_rate = (funnel_users_in_month / total_searchers * 100) if total_searchers > 0 else 0
-        
-        month_data.append({
-            'month': month,
-            'total_searchers': total_searchers,
-            'funnel_users': funnel_users_in_month,
-            'conversion_rate': conversion_rate
-        })
-    
-    # Create DataFrame and sort by month (1-12)
-    month_df = pd.DataFrame(month_data)
+    funnel_users = np.intersect1d(np.intersect1d(search_events['merged_amplitude_id'].unique(),
+                                                 click_events['merged_amplitude_id'].unique(),
+                                                 assume_unique=True),
+                                  reservations['renter_user_id'].unique(), assume_unique=True)
+    
+    # Analyze by month: distinct searchers per month, and distinct funnel users
+    # among them from the searches of funnel users only
+    funnel_searches = search_events[search_events['merged_amplitude_id'].isin(funnel_users)]
+    month_df = search_events.groupby('month')['merged_amplitude_id'].nunique().rename('total_searchers').to_frame()
+    month_df['funnel_users'] = (funnel_searches.groupby('month')['merged_amplitude_id'].nunique()
+                                .reindex(month_df.index, fill_value=0))
+    searchers = month_df['total_searchers']
+    month_df['conversion_rate'] = (month_df['funnel_users'] / searchers.where(searchers > 0) * 100).fillna(0.0)
+    
+    # Sort by month (1-12)
+    month_df = month_df.reset_index()
     month_df['month'] = month_df['month'].astype(int)
     month_df = month_df.sort_values('month')
     
@@ -99,6 +81,12 @@ def create_monthly_conversion_chart():
     print("="*60)
     print(month_df.to_string(index=False))
     
+    # No non-bot searches with a month: nothing to rank
+    if month_df.empty:
+        print("\nNo monthly search data; skipping insights.")
+        conn.close()
+        return month_df
+    
     # Calculate and display insights
     best_month = month_df.loc[month_df['conversion_rate'].idxmax()]
     worst_month = month_df.loc[month_df['conversion_rate'].idxmin()]
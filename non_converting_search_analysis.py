@@ -1,68 +1,97 @@
 import pandas as pd
 import numpy as np
+from csv_cache import load_cached
 
 def analyze_non_converting_searches():
     """
     Analyze characteristics of searches that do NOT convert to understand barriers.
     """
     
-    # Read the data files
+    # Read the data files through the Parquet cache, only the columns used below
     print("Loading data files...")
-    search_events = pd.read_csv('all_search_events (1).csv')
-    click_events = pd.read_csv('view_listing_detail_events (1).csv')
-    reservations = pd.read_csv('reservations (1).csv')
+    search_events = load_cached('all_search_events (1).csv', columns=[
+        'merged_amplitude_id', 'search_type', 'search_term', 'search_term_category', 'search_sort',
+        'search_dma', 'count_results', 'is_usa_canada', 'is_bot', 'is_host', 'month', 'event_time',
+        'first_attribution_source', 'first_attribution_channel'])
+    click_events = load_cached('view_listing_detail_events (1).csv', columns=['merged_amplitude_id'])
+    reservations = load_cached('reservations (1).csv', columns=['renter_user_id'])
     
     print(f"Loaded {len(search_events)} search events")
     print(f"Loaded {len(click_events)} click events")
     print(f"Loaded {len(reservations)} reservations")
     
-    # Convert timestamps to datetime
-    search_events['event_time'] = pd.to_datetime(search_events['event_time'])
-    click_events['event_time'] = pd.to_datetime(click_events['event_time'])
-    reservations['created_at'] = pd.to_datetime(reservations['created_at'])
-    
-    # Get users who completed the full funnel
-    searchers = set(search_events['merged_amplitude_id'].unique())
-    clickers = set(click_events['merged_amplitude_id'].unique())
-    reservers = set(reservations['renter_user_id'].unique())
+    # Low-cardinality string columns as categoricals, so the category groupbys
+    # below work on integer codes (the flags are already bool, month int)
+    for col in ['search_type', 'search_term', 'search_term_category', 'search_sort', 'search_dma',
+                'first_attribution_source', 'first_attribution_channel']:
+        search_events[col] = search_events[col].astype('category')
+    
+    # Binned and calendar columns, derived once into a side frame so the
+    # searches frame is not widened with them
+    event_time = search_events['event_time']
+    derived = pd.DataFrame({
+        'merged_amplitude_id': search_events['merged_amplitude_id'],
+        'result_count_bin': pd.cut(search_events['count_results'],
+                                   bins=[0, 10, 50, 100, 200, 1000],
+                                   labels=['1-10', '11-50', '51-100', '101-200', '200+']),
+        'term_length_bin': pd.cut(search_events['search_term'].str.len(),
+                                  bins=[0, 5, 10, 15, 30, 100],
+                                  labels=['1-5 chars', '6-10 chars', '11-15 chars', '16-30 chars', '30+ chars']),
+        'day_of_week': event_time.dt.day_name().astype('category'),
+        'hour_bin': pd.cut(event_time.dt.hour,
+                           bins=[0, 6, 12, 18, 24],
+                           labels=['Night (0-6)', 'Morning (6-12)', 'Afternoon (12-18)', 'Evening (18-24)']),
+        # Users with multiple searches vs single searches
+        'search_frequency': pd.cut(search_events.groupby('merged_amplitude_id')['merged_amplitude_id'].transform('size'),
+                                   bins=[0, 1, 3, 10, 100],
+                                   labels=['1 search', '2-3 searches', '4-10 searches', '10+ searches']),
+    })
+    
+    # Get users who completed the full funnel; ids stay in sorted numpy
+    # arrays rather than Python sets, so the set algebra runs in C
+    searchers = np.unique(search_events['merged_amplitude_id'].to_numpy())
+    clickers = np.unique(click_events['merged_amplitude_id'].to_numpy())
+    reservers = np.unique(reservations['renter_user_id'].to_numpy())
     
     # Users who did the full funnel
-    funnel_users = searchers.intersection(clickers).intersection(reservers)
+    funnel_users = np.intersect1d(np.intersect1d(searchers, clickers, assume_unique=True),
+                                  reservers, assume_unique=True)
     
     # Users who searched but did NOT convert
-    non_converting_searchers = searchers - funnel_users
+    non_converting_searchers = np.setdiff1d(searchers, funnel_users, assume_unique=True)
     
     print(f"Total searchers: {len(searchers):,}")
     print(f"Funnel users (converted): {len(funnel_users):,}")
     print(f"Non-converting searchers: {len(non_converting_searchers):,}")
     print(f"Non-conversion rate: {len(non_converting_searchers) / len(searchers) * 100:.2f}%")
     
+    # Which searches belong to a non-converting searcher, computed once for all
+    # the category breakdowns (search_events and derived share row order)
+    non_converting_rows = search_events['merged_amplitude_id'].isin(non_converting_searchers).to_numpy()
+    
+    # Count distinct searchers per category, and how many of them own a search
+    # flagged in user_rows: one groupby over all searches, one over the flagged
+    def count_users_by_category(df, category_col, user_rows):
+        df = df[[category_col, 'merged_amplitude_id']]
+        by_category = df.groupby(category_col, sort=False, observed=True)['merged_amplitude_id']
+        total = by_category.nunique()
+        user_searches = df[user_rows]
+        matched = (user_searches.groupby(category_col, sort=False, observed=True)['merged_amplitude_id']
+                   .nunique().reindex(total.index, fill_value=0))
+        return total, matched
+    
     # Create a function to analyze non-conversion by category
     def analyze_non_conversion_by_category(df, category_col, min_count=100):
-        results = []
+        total, non_converting = count_users_by_category(df, category_col, non_converting_rows)
+        results = pd.DataFrame({
+            'category': total.index,
+            'total_searchers': total.to_numpy(),
+            'non_converting_users': non_converting.to_numpy(),
+        })
+        results['non_conversion_rate'] = results['non_converting_users'] / results['total_searchers'] * 100
+        results = results[results['total_searchers'] >= min_count]
         
-        for category in df[category_col].unique():
-            if pd.isna(category):
-                continue
-                
-            # Get searches for this category
-            category_searches = df[df[category_col] == category]
-            category_users = set(category_searches['merged_amplitude_id'].unique())
-            
-            # Calculate non-conversion metrics
-            total_searchers = len(category_users)
-            non_converting_in_category = len(category_users.intersection(non_converting_searchers))
-            non_conversion_rate = (non_converting_in_category / total_searchers * 100) if total_searchers > 0 else 0
-            
-            if total_searchers >= min_count:
-                results.append({
-                    'category': category,
-                    'total_searchers': total_searchers,
-                    'non_converting_users': non_converting_in_category,
-                    'non_conversion_rate': non_conversion_rate
-                })
-        
-        return pd.DataFrame(results).sort_values('non_conversion_rate', ascending=False)
+        return results.sort_values('non_conversion_rate', ascending=False)
     
     # Analyze non-conversion by different search characteristics
     print("\n" + "="*80)
@@ -94,11 +123,7 @@ def analyze_non_converting_searches():
     print("NON-CONVERSION BY SEARCH RESULT COUNT")
     print("="*80)
     
-    search_events['result_count_bin'] = pd.cut(search_events['count_results'], 
-                                               bins=[0, 10, 50, 100, 200, 1000], 
-                                               labels=['1-10', '11-50', '51-100', '101-200', '200+'])
-    
-    result_count_analysis = analyze_non_conversion_by_category(search_events, 'result_count_bin', min_count=50)
+    result_count_analysis = analyze_non_conversion_by_category(derived, 'result_count_bin', min_count=50)
     print(result_count_analysis.to_string(index=False))
     
     # Analyze by search term length
@@ -106,12 +131,7 @@ def analyze_non_converting_searches():
     print("NON-CONVERSION BY SEARCH TERM LENGTH")
     print("="*80)
     
-    search_events['search_term_length'] = search_events['search_term'].str.len()
-    search_events['term_length_bin'] = pd.cut(search_events['search_term_length'], 
-                                             bins=[0, 5, 10, 15, 30, 100], 
-                                             labels=['1-5 chars', '6-10 chars', '11-15 chars', '16-30 chars', '30+ chars'])
-    
-    term_length_analysis = analyze_non_conversion_by_category(search_events, 'term_length_bin', min_count=50)
+    term_length_analysis = analyze_non_conversion_by_category(derived, 'term_length_bin', min_count=50)
     print(term_length_analysis.to_string(index=False))
     
     # Analyze by geographic characteristics
@@ -148,18 +168,12 @@ def analyze_non_converting_searches():
     print(month_analysis.to_string(index=False))
     
     # Day of week analysis
-    search_events['day_of_week'] = search_events['event_time'].dt.day_name()
-    dow_analysis = analyze_non_conversion_by_category(search_events, 'day_of_week', min_count=50)
+    dow_analysis = analyze_non_conversion_by_category(derived, 'day_of_week', min_count=50)
     print("\nNon-conversion by Day of Week:")
     print(dow_analysis.to_string(index=False))
     
     # Hour analysis
-    search_events['hour'] = search_events['event_time'].dt.hour
-    search_events['hour_bin'] = pd.cut(search_events['hour'], 
-                                      bins=[0, 6, 12, 18, 24], 
-                                      labels=['Night (0-6)', 'Morning (6-12)', 'Afternoon (12-18)', 'Evening (18-24)'])
-    
-    hour_analysis = analyze_non_conversion_by_category(search_events, 'hour_bin', min_count=50)
+    hour_analysis = analyze_non_conversion_by_category(derived, 'hour_bin', min_count=50)
     print("\nNon-conversion by Time of Day:")
     print(hour_analysis.to_string(index=False))
     
@@ -194,14 +208,7 @@ def analyze_non_converting_searches():
     print("NON-CONVERSION BY SEARCH BEHAVIOR")
     print("="*80)
     
-    # Users with multiple searches vs single searches
-    user_search_counts = search_events.groupby('merged_amplitude_id').size()
-    search_events['user_search_count'] = search_events['merged_amplitude_id'].map(user_search_counts)
-    search_events['search_frequency'] = pd.cut(search_events['user_search_count'], 
-                                              bins=[0, 1, 3, 10, 100], 
-                                              labels=['1 search', '2-3 searches', '4-10 searches', '10+ searches'])
-    
-    frequency_analysis = analyze_non_conversion_by_category(search_events, 'search_frequency', min_count=50)
+    frequency_analysis = analyze_non_conversion_by_category(derived, 'search_frequency', min_count=50)
     print("Non-conversion by Search Frequency:")
     print(frequency_analysis.to_string(index=False))
     
@@ -211,41 +218,28 @@ def analyze_non_converting_searches():
     print("="*80)
     
     # Users who searched but never clicked
-    searchers_who_never_clicked = searchers - clickers
+    searchers_who_never_clicked = np.setdiff1d(searchers, clickers, assume_unique=True)
     print(f"Users who searched but never clicked: {len(searchers_who_never_clicked):,}")
     print(f"Search-to-click drop-off rate: {len(searchers_who_never_clicked) / len(searchers) * 100:.2f}%")
+    never_clicked_rows = search_events['merged_amplitude_id'].isin(searchers_who_never_clicked).to_numpy()
     
     # Users who clicked but never reserved
-    clickers_who_never_reserved = clickers - reservers
+    clickers_who_never_reserved = np.setdiff1d(clickers, reservers, assume_unique=True)
     print(f"Users who clicked but never reserved: {len(clickers_who_never_reserved):,}")
     print(f"Click-to-reserve drop-off rate: {len(clickers_who_never_reserved) / len(clickers) * 100:.2f}%")
     
     # Analyze characteristics of users who never clicked
     def analyze_never_clicked_by_category(df, category_col, min_count=100):
-        results = []
-        
-        for category in df[category_col].unique():
-            if pd.isna(category):
-                continue
-                
-            # Get searches for this category
-            category_searches = df[df[category_col] == category]
-            category_users = set(category_searches['merged_amplitude_id'].unique())
-            
-            # Calculate never-clicked metrics
-            total_searchers = len(category_users)
-            never_clicked_in_category = len(category_users.intersection(searchers_who_never_clicked))
-            never_clicked_rate = (never_clicked_in_category / total_searchers * 100) if total_searchers > 0 else 0
-            
-            if total_searchers >= min_count:
-                results.append({
-                    'category': category,
-                    'total_searchers': total_searchers,
-                    'never_clicked_users': never_clicked_in_category,
-                    'never_clicked_rate': never_clicked_rate
-                })
+        total, never_clicked = count_users_by_category(df, category_col, never_clicked_rows)
+        results = pd.DataFrame({
+            'category': total.index,
+            'total_searchers': total.to_numpy(),
+            'never_clicked_users': never_clicked.to_numpy(),
+        })
+        results['never_clicked_rate'] = results['never_clicked_users'] / results['total_searchers'] * 100
+        results = results[results['total_searchers'] >= min_count]
         
-        return pd.DataFrame(results).sort_values('never_clicked_rate', ascending=False)
+        return results.sort_values('never_clicked_rate', ascending=False)
     
     print("\nSearch types with highest never-clicked rates:")
     never_clicked_by_type = analyze_never_clicked_by_category(search_events, 'search_type', min_count=50)
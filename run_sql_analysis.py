@@ -7,32 +7,26 @@ This script executes the SQL analysis queries and displays the results.
 """
 
 import pandas as pd
-import sqlite3
 import os
+from csv_cache import load_cached
+from db import ensure_schema, get_conn
 
 def create_database():
     """Create SQLite database from CSV files"""
     print("Creating SQLite database from CSV files...")
     
-    # Load CSV files
-    search_events = pd.read_csv('all_search_events (1).csv')
-    listing_views = pd.read_csv('view_listing_detail_events (1).csv')
-    reservations = pd.read_csv('reservations (1).csv')
-    user_ids = pd.read_csv('amplitude_user_ids (1).csv')
+    # Load the exports from their typed Parquet copies (parsed from CSV only on first use)
+    search_events = load_cached('all_search_events (1).csv')
+    listing_views = load_cached('view_listing_detail_events (1).csv')
+    reservations = load_cached('reservations (1).csv')
+    user_ids = load_cached('amplitude_user_ids (1).csv')
     
-    # Convert date columns
-    search_events['event_time'] = pd.to_datetime(search_events['event_time'])
-    search_events['event_date'] = pd.to_datetime(search_events['event_date'])
+    # Shared database connection (WAL mode, which the other scripts rely on)
+    conn = get_conn()
     
-    listing_views['event_time'] = pd.to_datetime(listing_views['event_time'])
-    listing_views['event_date'] = pd.to_datetime(listing_views['event_date'])
-    
-    reservations['created_at'] = pd.to_datetime(reservations['created_at'])
-    reservations['approved_at'] = pd.to_datetime(reservations['approved_at'])
-    reservations['successful_payment_collected_at'] = pd.to_datetime(reservations['successful_payment_collected_at'])
-    
-    # Create database
-    conn = sqlite3.connect('marketplace_analysis.db')
+    # Bulk-load setting: the tables are rebuilt from the exports on every run,
+    # so skip the fsyncs; the WAL journal still keeps the file consistent
+    conn.execute('PRAGMA synchronous=OFF')
     
     # Write data to database
     search_events.to_sql('search_events', conn, if_exists='replace', index=False)
@@ -40,6 +34,10 @@ def create_database():
     reservations.to_sql('reservations', conn, if_exists='replace', index=False)
     user_ids.to_sql('amplitude_user_ids', conn, if_exists='replace', index=False)
     
+    # Replacing the tables dropped any earlier indexes; the shared schema step
+    # rebuilds them (covering the join keys below) and the planner stats
+    ensure_schema(conn, reloaded=True)
+    
     print(f"Database created with {len(search_events):,} search events, {len(listing_views):,} listing views, {len(reservations):,} reservations")
     return conn
 
@@ -157,26 +155,51 @@ def run_sql_queries(conn):
     ),
     cleaned_reservations AS (
         SELECT * FROM reservations WHERE renter_user_id IS NOT NULL
+    ),
+    -- Distinct counts per DMA are taken on each table before joining, rather
+    -- than over the searches x views x reservations rows of each DMA
+    dma_searchers AS (
+        SELECT search_dma, COUNT(DISTINCT merged_amplitude_id) AS unique_searchers
+        FROM cleaned_search_events
+        GROUP BY search_dma
+    ),
+    dma_viewers AS (
+        SELECT click_dma, COUNT(DISTINCT merged_amplitude_id) AS unique_viewers
+        FROM cleaned_listing_views
+        GROUP BY click_dma
+    ),
+    dma_reservers AS (
+        SELECT 
+            l.click_dma,
+            COUNT(DISTINCT r.renter_user_id) AS unique_reservers,
+            COUNT(DISTINCT CASE WHEN r.successful_payment_collected_at IS NOT NULL 
+                               THEN r.renter_user_id END) AS unique_payers
+        FROM (SELECT DISTINCT click_dma, listing_id FROM cleaned_listing_views) l
+        JOIN cleaned_reservations r ON l.listing_id = r.listing_id
+        GROUP BY l.click_dma
+    ),
+    dma_counts AS (
+        SELECT 
+            s.search_dma,
+            s.unique_searchers,
+            COALESCE(v.unique_viewers, 0) AS unique_viewers,
+            COALESCE(r.unique_reservers, 0) AS unique_reservers,
+            COALESCE(r.unique_payers, 0) AS unique_payers
+        FROM dma_searchers s
+        LEFT JOIN dma_viewers v ON s.search_dma = v.click_dma
+        LEFT JOIN dma_reservers r ON s.search_dma = r.click_dma
     )
     SELECT 
-        s.search_dma,
-        COUNT(DISTINCT s.merged_amplitude_id) AS unique_searchers,
-        COUNT(DISTINCT l.merged_amplitude_id) AS unique_viewers,
-        COUNT(DISTINCT r.renter_user_id) AS unique_reservers,
-        COUNT(DISTINCT CASE WHEN r.successful_payment_collected_at IS NOT NULL 
-                           THEN r.renter_user_id END) AS unique_payers,
-        ROUND(COUNT(DISTINCT l.merged_amplitude_id) * 100.0 / 
-              NULLIF(COUNT(DISTINCT s.merged_amplitude_id), 0), 2) AS search_to_view_rate,
-        ROUND(COUNT(DISTINCT r.renter_user_id) * 100.0 / 
-              NULLIF(COUNT(DISTINCT l.merged_amplitude_id), 0), 2) AS view_to_reserve_rate,
-        ROUND(COUNT(DISTINCT CASE WHEN r.successful_payment_collected_at IS NOT NULL 
-                              THEN r.renter_user_id END) * 100.0 / 
-              NULLIF(COUNT(DISTINCT r.renter_user_id), 0), 2) AS reserve_to_pay_rate
-    FROM cleaned_search_events s
-    LEFT JOIN cleaned_listing_views l ON s.search_dma = l.click_dma
-    LEFT JOIN cleaned_reservations r ON l.listing_id = r.listing_id
-    GROUP BY s.search_dma
-    HAVING COUNT(DISTINCT s.merged_amplitude_id) >= 50
+        search_dma,
+        unique_searchers,
+        unique_viewers,
+        unique_reservers,
+        unique_payers,
+        ROUND(unique_viewers * 100.0 / NULLIF(unique_searchers, 0), 2) AS search_to_view_rate,
+        ROUND(unique_reservers * 100.0 / NULLIF(unique_viewers, 0), 2) AS view_to_reserve_rate,
+        ROUND(unique_payers * 100.0 / NULLIF(unique_reservers, 0), 2) AS reserve_to_pay_rate
+    FROM dma_counts
+    WHERE unique_searchers >= 50
     ORDER BY unique_searchers DESC
     LIMIT 10
     """
@@ -196,20 +219,44 @@ def run_sql_queries(conn):
     ),
     cleaned_reservations AS (
         SELECT * FROM reservations WHERE renter_user_id IS NOT NULL
+    ),
+    -- Each table is aggregated by month on its own and the results joined;
+    -- every search in a month was repeated equally often by the old row-level
+    -- join, so the average result count is unchanged
+    month_searches AS (
+        SELECT 
+            month,
+            COUNT(DISTINCT merged_amplitude_id) AS unique_searchers,
+            COUNT(DISTINCT search_id) AS total_searches,
+            ROUND(AVG(count_results), 2) AS avg_search_results
+        FROM cleaned_search_events
+        GROUP BY month
+    ),
+    month_viewers AS (
+        SELECT month, COUNT(DISTINCT merged_amplitude_id) AS unique_viewers
+        FROM cleaned_listing_views
+        GROUP BY month
+    ),
+    month_reservers AS (
+        SELECT 
+            CAST(strftime('%m', created_at) AS INTEGER) AS month,
+            COUNT(DISTINCT renter_user_id) AS unique_reservers,
+            COUNT(DISTINCT CASE WHEN successful_payment_collected_at IS NOT NULL 
+                               THEN renter_user_id END) AS unique_payers
+        FROM cleaned_reservations
+        GROUP BY CAST(strftime('%m', created_at) AS INTEGER)
     )
     SELECT 
         s.month,
-        COUNT(DISTINCT s.merged_amplitude_id) AS unique_searchers,
-        COUNT(DISTINCT l.merged_amplitude_id) AS unique_viewers,
-        COUNT(DISTINCT r.renter_user_id) AS unique_reservers,
-        COUNT(DISTINCT CASE WHEN r.successful_payment_collected_at IS NOT NULL 
-                           THEN r.renter_user_id END) AS unique_payers,
-        COUNT(DISTINCT s.search_id) AS total_searches,
-        ROUND(AVG(s.count_results), 2) AS avg_search_results
-    FROM cleaned_search_events s
-    LEFT JOIN cleaned_listing_views l ON s.month = l.month
-    LEFT JOIN cleaned_reservations r ON CAST(strftime('%m', r.created_at) AS INTEGER) = s.month
-    GROUP BY s.month
+        s.unique_searchers,
+        COALESCE(v.unique_viewers, 0) AS unique_viewers,
+        COALESCE(r.unique_reservers, 0) AS unique_reservers,
+        COALESCE(r.unique_payers, 0) AS unique_payers,
+        s.total_searches,
+        s.avg_search_results
+    FROM month_searches s
+    LEFT JOIN month_viewers v ON s.month = v.month
+    LEFT JOIN month_reservers r ON s.month = r.month
     ORDER BY s.month
     """
     
@@ -280,9 +327,6 @@ def main():
     # Run SQL queries
     results = run_sql_queries(conn)
     
-    # Close connection
-    conn.close()
-    
     print("\n" + "="*60)
     print("ANALYSIS COMPLETE")
     print("="*60)
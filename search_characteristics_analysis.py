@@ -22,12 +22,13 @@ def analyze_search_characteristics():
     reservations['created_at'] = pd.to_datetime(reservations['created_at'])
     
     # Get users who completed the full funnel
-    searchers = set(search_events['merged_amplitude_id'].unique())
-    clickers = set(click_events['merged_amplitude_id'].unique())
-    reservers = set(reservations['renter_user_id'].unique())
+    searchers = search_events['merged_amplitude_id'].unique()
+    clickers = click_events['merged_amplitude_id'].unique()
+    reservers = reservations['renter_user_id'].unique()
     
     # Users who did the full funnel
-    funnel_users = searchers.intersection(clickers).intersection(reservers)
+    funnel_users = np.intersect1d(np.intersect1d(searchers, clickers, assume_unique=True),
+                                  reservers, assume_unique=True)
     
     print(f"Total funnel users (searched -> clicked -> reserved): {len(funnel_users):,}")
     
@@ -41,11 +42,11 @@ def analyze_search_characteristics():
                 
             # Get searches for this category
             category_searches = df[df[category_col] == category]
-            category_users = set(category_searches['merged_amplitude_id'].unique())
+            category_users = category_searches['merged_amplitude_id'].unique()
             
             # Calculate conversion metrics
             total_searchers = len(category_users)
-            funnel_users_in_category = len(category_users.intersection(funnel_users))
+            funnel_users_in_category = np.isin(category_users, funnel_users, assume_unique=True).sum()
             conversion_rate = (funnel_users_in_category / total_searchers * 100) if total_searchers > 0 else 0
             
             if total_searchers >= min_count:
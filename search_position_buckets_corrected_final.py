@@ -14,7 +14,7 @@ def create_search_position_buckets_corrected_final():
     print("Calculating REAL conversion rates by search position buckets...")
     
     # Load data with proper filtering
-    click_events = pd.read_sql_query("SELECT * FROM listing_views WHERE is_bot = 'False'", conn)
+    click_events = pd.read_sql_query("SELECT * FROM listing_views WHERE is_bot IN (0, 'False')", conn)
     reservations = pd.read_sql_query("SELECT * FROM reservations WHERE approved_at IS NOT NULL", conn)
     
     # Convert timestamps
@@ -26,7 +26,7 @@ def create_search_position_buckets_corrected_final():
     print(f"Total approved reservations: {len(reservations):,}")
     
     # Get users who made approved reservations (converted)
-    approved_reservers = set(reservations['renter_user_id'].unique())
+    approved_reservers = reservations['renter_user_id'].unique()
     print(f"Unique approved reservers: {len(approved_reservers):,}")
     
     # Define position buckets
@@ -45,7 +45,7 @@ def create_search_position_buckets_corrected_final():
             (click_events['search_position'].astype(str).astype(int) >= start_pos) & 
             (click_events['search_position'].astype(str).astype(int) <= end_pos)
         ]
-        bucket_users = set(bucket_clicks['merged_amplitude_id'].unique())
+        bucket_users = bucket_clicks['merged_amplitude_id'].unique()
         
         # Calculate metrics
         total_clickers = len(bucket_users)
@@ -14,8 +14,8 @@ def create_search_position_conversion_chart():
     print("Loading data for search position conversion analysis...")
     
     # Load data
-    search_events = pd.read_sql_query("SELECT * FROM search_events WHERE is_bot = 'False'", conn)
-    click_events = pd.read_sql_query("SELECT * FROM listing_views WHERE is_bot = 'False'", conn)
+    search_events = pd.read_sql_query("SELECT * FROM search_events WHERE is_bot IN (0, 'False')", conn)
+    click_events = pd.read_sql_query("SELECT * FROM listing_views WHERE is_bot IN (0, 'False')", conn)
     reservations = pd.read_sql_query("SELECT * FROM reservations", conn)
     
     # Convert timestamps
@@ -25,13 +25,13 @@ def create_search_position_conversion_chart():
     
     # Get users who completed the full funnel
     # Note: reservations uses renter_user_id, others use merged_amplitude_id
-    searchers = set(search_events['merged_amplitude_id'].unique())
-    clickers = set(click_events['merged_amplitude_id'].unique())
-    reservers = set(reservations['renter_user_id'].unique())
+    searchers = search_events['merged_amplitude_id'].unique()
+    clickers = click_events['merged_amplitude_id'].unique()
+    reservers = reservations['renter_user_id'].unique()
     
     # For this analysis, we'll focus on users who clicked and then converted
     # We'll use users who have both clicks and reservations
-    funnel_users = clickers.intersection(reservers)
+    funnel_users = np.intersect1d(clickers, reservers, assume_unique=True)
     
     # Analyze by search position
     # First, let's see what search positions are available
@@ -45,11 +45,11 @@ def create_search_position_conversion_chart():
     for position in range(1, 21):  # Positions 1-20
         # Get clicks for this position
         position_clicks = click_events[click_events['search_position'] == position]
-        position_users = set(position_clicks['merged_amplitude_id'].unique())
+        position_users = position_clicks['merged_amplitude_id'].unique()
         
         # Calculate metrics - users who clicked on this position AND converted
         total_clickers = len(position_users)
-        funnel_users_in_position = len(position_users.intersection(funnel_users))
+        funnel_users_in_position = np.isin(position_users, funnel_users, assume_unique=True).sum()
         conversion_rate = (funnel_users_in_position / total_clickers * 100) if total_clickers > 0 else 0
         
         position_data.append({
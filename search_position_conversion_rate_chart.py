@@ -14,7 +14,7 @@ def create_search_position_conversion_rate_chart():
     print("Loading data for search position conversion rate analysis...")
     
     # Load data
-    click_events = pd.read_sql_query("SELECT * FROM listing_views WHERE is_bot = 'False'", conn)
+    click_events = pd.read_sql_query("SELECT * FROM listing_views WHERE is_bot IN (0, 'False')", conn)
     reservations = pd.read_sql_query("SELECT * FROM reservations", conn)
     
     # Convert timestamps
@@ -29,7 +29,7 @@ def create_search_position_conversion_rate_chart():
     for position in range(1, 21):  # Positions 1-20
         # Get clicks for this position
         position_clicks = click_events[click_events['search_position'] == str(position)]
-        position_users = set(position_clicks['merged_amplitude_id'].unique())
+        position_users = position_clicks['merged_amplitude_id'].unique()
         
         # Get users who made reservations (converted)
         # We need to match merged_amplitude_id with renter_user_id
@@ -14,7 +14,7 @@ def create_search_position_simple_chart():
     print("Loading data for search position analysis...")
     
     # Load click events data
-    click_events = pd.read_sql_query("SELECT * FROM listing_views WHERE is_bot = 'False'", conn)
+    click_events = pd.read_sql_query("SELECT * FROM listing_views WHERE is_bot IN (0, 'False')", conn)
     
     # Analyze by search position
     print("Available search positions:")
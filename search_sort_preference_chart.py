@@ -14,8 +14,8 @@ def create_search_sort_preference_chart():
     print("Loading data for search sort preference analysis...")
     
     # Load data
-    search_events = pd.read_sql_query("SELECT * FROM search_events WHERE is_bot = 'False'", conn)
-    click_events = pd.read_sql_query("SELECT * FROM listing_views WHERE is_bot = 'False'", conn)
+    search_events = pd.read_sql_query("SELECT * FROM search_events WHERE is_bot IN (0, 'False')", conn)
+    click_events = pd.read_sql_query("SELECT * FROM listing_views WHERE is_bot IN (0, 'False')", conn)
     reservations = pd.read_sql_query("SELECT * FROM reservations", conn)
     
     # Convert timestamps
@@ -24,10 +24,11 @@ def create_search_sort_preference_chart():
     reservations['created_at'] = pd.to_datetime(reservations['created_at'])
     
     # Get users who completed the full funnel
-    searchers = set(search_events['merged_amplitude_id'].unique())
-    clickers = set(click_events['merged_amplitude_id'].unique())
-    reservers = set(reservations['renter_user_id'].unique())
-    funnel_users = searchers.intersection(clickers).intersection(reservers)
+    searchers = search_events['merged_amplitude_id'].unique()
+    clickers = click_events['merged_amplitude_id'].unique()
+    reservers = reservations['renter_user_id'].unique()
+    funnel_users = np.intersect1d(np.intersect1d(searchers, clickers, assume_unique=True),
+                                  reservers, assume_unique=True)
     
     # Analyze by search sort preference
     sort_preferences = search_events['search_sort'].unique()
@@ -39,11 +40,11 @@ def create_search_sort_preference_chart():
             
         # Get searches for this sort type
         sort_searches = search_events[search_events['search_sort'] == sort_type]
-        sort_users = set(sort_searches['merged_amplitude_id'].unique())
+        sort_users = sort_searches['merged_amplitude_id'].unique()
         
         # Calculate metrics
         total_searchers = len(sort_users)
-        funnel_users_in_sort = len(sort_users.intersection(funnel_users))
+        funnel_users_in_sort = np.isin(sort_users, funnel_users, assume_unique=True).sum()
         conversion_rate = (funnel_users_in_sort / total_searchers * 100) if total_searchers > 0 else 0
         
         sort_data.append({
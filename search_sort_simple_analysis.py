@@ -27,7 +27,7 @@ def analyze_conversion_by_search_sort():
         is_host
     FROM search_events 
     WHERE search_sort IS NOT NULL 
-    AND is_bot = 'False'
+    AND is_bot IN (0, 'False')
     """
     
     search_events = pd.read_sql_query(query, conn)
@@ -36,7 +36,7 @@ def analyze_conversion_by_search_sort():
     conversion_query = """
     SELECT DISTINCT se.merged_amplitude_id
     FROM search_events se
-    WHERE se.is_bot = 'False'
+    WHERE se.is_bot IN (0, 'False')
     AND EXISTS (
         SELECT 1 FROM listing_views lv 
         WHERE lv.merged_amplitude_id = se.merged_amplitude_id
@@ -44,10 +44,10 @@ def analyze_conversion_by_search_sort():
     """
     
     converting_users = pd.read_sql_query(conversion_query, conn)
-    converting_user_set = set(converting_users['merged_amplitude_id'].unique())
+    converting_user_ids = converting_users['merged_amplitude_id'].unique()
     
     print(f"Total search events analyzed: {len(search_events):,}")
-    print(f"Total converting users: {len(converting_user_set):,}")
+    print(f"Total converting users: {len(converting_user_ids):,}")
     
     # Analyze conversion by search sort
     def analyze_by_search_sort():
@@ -59,11 +59,11 @@ def analyze_conversion_by_search_sort():
                 
             # Get users who used this sort type
             sort_searches = search_events[search_events['search_sort'] == sort_type]
-            sort_users = set(sort_searches['merged_amplitude_id'].unique())
+            sort_users = sort_searches['merged_amplitude_id'].unique()
             
             # Calculate conversion metrics
             total_users = len(sort_users)
-            converting_users_count = len(sort_users.intersection(converting_user_set))
+            converting_users_count = np.isin(sort_users, converting_user_ids, assume_unique=True).sum()
             conversion_rate = (converting_users_count / total_users * 100) if total_users > 0 else 0
             
             # Additional metrics
@@ -172,8 +172,8 @@ def analyze_conversion_by_search_sort():
         print(f"  - Avg Searches per User: {row['avg_searches_per_user']:.2f}")
     
     # Calculate overall conversion rate for comparison
-    total_users = len(set(search_events['merged_amplitude_id'].unique()))
-    overall_conversion_rate = (len(converting_user_set) / total_users * 100) if total_users > 0 else 0
+    total_users = len(search_events['merged_amplitude_id'].unique())
+    overall_conversion_rate = (len(converting_user_ids) / total_users * 100) if total_users > 0 else 0
     
     print(f"\nOVERALL CONVERSION RATE: {overall_conversion_rate:.2f}%")
     
@@ -14,8 +14,8 @@ def create_search_term_category_chart():
     print("Loading data for search term category analysis...")
     
     # Load data
-    search_events = pd.read_sql_query("SELECT * FROM search_events WHERE is_bot = 'False'", conn)
-    click_events = pd.read_sql_query("SELECT * FROM listing_views WHERE is_bot = 'False'", conn)
+    search_events = pd.read_sql_query("SELECT * FROM search_events WHERE is_bot IN (0, 'False')", conn)
+    click_events = pd.read_sql_query("SELECT * FROM listing_views WHERE is_bot IN (0, 'False')", conn)
     reservations = pd.read_sql_query("SELECT * FROM reservations", conn)
     
     # Convert timestamps
@@ -24,10 +24,11 @@ def create_search_term_category_chart():
     reservations['created_at'] = pd.to_datetime(reservations['created_at'])
     
     # Get users who completed the full funnel
-    searchers = set(search_events['merged_amplitude_id'].unique())
-    clickers = set(click_events['merged_amplitude_id'].unique())
-    reservers = set(reservations['renter_user_id'].unique())
-    funnel_users = searchers.intersection(clickers).intersection(reservers)
+    searchers = search_events['merged_amplitude_id'].unique()
+    clickers = click_events['merged_amplitude_id'].unique()
+    reservers = reservations['renter_user_id'].unique()
+    funnel_users = np.intersect1d(np.intersect1d(searchers, clickers, assume_unique=True),
+                                  reservers, assume_unique=True)
     
     # Analyze by search term category
     categories = search_events['search_term_category'].unique()
@@ -39,11 +40,11 @@ def create_search_term_category_chart():
             
         # Get searches for this category
         category_searches = search_events[search_events['search_term_category'] == category]
-        category_users = set(category_searches['merged_amplitude_id'].unique())
+        category_users = category_searches['merged_amplitude_id'].unique()
         
         # Calculate metrics
         total_searchers = len(category_users)
-        funnel_users_in_category = len(category_users.intersection(funnel_users))
+        funnel_users_in_category = np.isin(category_users, funnel_users, assume_unique=True).sum()
         conversion_rate = (funnel_users_in_category / total_searchers * 100) if total_searchers > 0 else 0
         
         category_data.append({
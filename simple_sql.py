@@ -9,6 +9,7 @@ A lightweight SQL interface that doesn't require pandas.
 import sqlite3
 import csv
 import os
+from db import ensure_schema
 
 def create_database():
     """Create database from CSV files"""
@@ -62,6 +63,9 @@ def create_database():
                 conn.execute('INSERT INTO amplitude_user_ids VALUES (' + ','.join(['?' for _ in headers]) + ')', row)
         
         conn.commit()
+        
+        # Integer flags and user IDs, derived tables and indexes shared by all scripts
+        ensure_schema(conn, reloaded=True)
         conn.close()
         print("Database created successfully!")
     else: